@@ -0,0 +1,292 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+from recipes.models import IngredientAmount, Recipe
+from recipes.reference_cache import tags_cache
+from rest_framework.exceptions import (APIException, AuthenticationFailed,
+                                       NotAuthenticated, NotFound)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+from users.models import User
+from users.serializers import get_followed_ids, set_subscription_flags
+from users.views import UserViewSet
+
+from .conditional import get_not_modified, set_validators
+from .serializers import (RecipeReadSerializer, SubscriptionSerializer,
+                          TagSerializer, get_recipe_flags, get_recipes_limit,
+                          set_author_recipes, set_recipe_flags)
+from .views import (IngredientsViewSet, RecipeViewSet, TagsViewSet,
+                    search_ingredients)
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def database_sync_to_async(func):
+    """Выполняет синхронную функцию с запросами к БД в пуле потоков.
+
+    В Django 3.2 нет асинхронного ORM, а sync_to_async
+    с thread_sensitive=True выполняет синхронный код всего процесса
+    в одном потоке. Здесь каждый вызов идёт в свободный поток пула
+    со своим соединением с БД, поэтому независимые запросы
+    выполняются одновременно. Размер пула ограничивает и число
+    соединений процесса.
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def get_authenticators():
+    return [
+        authenticator()
+        for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ]
+
+
+def authenticate(request):
+    """Запрос DRF с пользователем, найденным по токену.
+
+    Аутентификацию выполняет первое обращение к request.user.
+    """
+    request = Request(request, authenticators=get_authenticators())
+    request.user
+    return request
+
+
+def render(data, status=200, headers=None):
+    response = HttpResponse(
+        JSONRenderer().render(data),
+        status=status,
+        content_type='application/json',
+    )
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def render_exception(request, exc):
+    response = exception_handler(exc, {})
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        response['WWW-Authenticate'] = (
+            get_authenticators()[0].authenticate_header(request)
+        )
+    return render(response.data, response.status_code, {
+        name: value for name, value in response.items()
+    })
+
+
+def async_read_view(read, sync_view, get_etag=None):
+    """Асинхронная вьюха для чтения.
+
+    GET и HEAD обрабатывает корутина read(request, **kwargs):
+    она загружает всё нужное из БД и возвращает функцию,
+    которая строит данные ответа уже без запросов.
+    Если задана get_etag, сначала проверяется условный запрос.
+    Остальные методы передаются синхронной вьюхе DRF.
+    """
+    async def view(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        etag = None
+        try:
+            request = await database_sync_to_async(authenticate)(request)
+            if get_etag is not None:
+                etag = await database_sync_to_async(get_etag)(
+                    request, **kwargs
+                )
+            not_modified = get_not_modified(request, etag)
+            if not_modified is not None:
+                return set_validators(not_modified, etag)
+            build = await read(request, **kwargs)
+            started = time.perf_counter()
+            response = render(build())
+        except APIException as exc:
+            return render_exception(request, exc)
+        timings = getattr(request, 'metrics_timings', None)
+        if timings is not None:
+            timings.serialize += time.perf_counter() - started
+        return set_validators(response, etag)
+
+    view.csrf_exempt = True
+    return view
+
+
+def set_prefetched(instance, name, objects):
+    """Кладёт объекты в кэш prefetch_related связи name"""
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    instance.__dict__.setdefault('_prefetched_objects_cache', {})[name] = (
+        queryset
+    )
+
+
+def load_authors(author_ids):
+    return {
+        author.pk: author
+        for author in User.objects.filter(pk__in=author_ids)
+    }
+
+
+def load_tags(recipe_ids):
+    tags = {}
+    for recipe_tag in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).select_related('tag').order_by('tag__name'):
+        tags.setdefault(recipe_tag.recipe_id, []).append(recipe_tag.tag)
+    return tags
+
+
+def load_amounts(recipe_ids):
+    amounts = {}
+    for amount in IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids
+    ).select_related('ingredient'):
+        amounts.setdefault(amount.recipe_id, []).append(amount)
+    return amounts
+
+
+async def load_related(recipe_ids, user):
+    """Одновременно загружает всё, что читает сериализатор рецептов.
+
+    Авторы выбираются подзапросом по id рецептов, поэтому загрузку
+    можно начать, ещё не прочитав сами рецепты.
+    """
+    author_ids = Recipe.objects.filter(
+        pk__in=recipe_ids
+    ).values('author_id')
+    authors, tags, amounts, flags, followed = await asyncio.gather(
+        database_sync_to_async(load_authors)(author_ids),
+        database_sync_to_async(load_tags)(recipe_ids),
+        database_sync_to_async(load_amounts)(recipe_ids),
+        database_sync_to_async(get_recipe_flags)(recipe_ids, user),
+        database_sync_to_async(get_followed_ids)(author_ids, user),
+    )
+    return {
+        'authors': authors,
+        'tags': tags,
+        'amounts': amounts,
+        'flags': flags,
+        'followed': followed,
+    }
+
+
+def attach_related(recipes, related, user):
+    for recipe in recipes:
+        recipe.author = related['authors'].get(recipe.author_id)
+        set_prefetched(recipe, 'tags', related['tags'].get(recipe.pk, []))
+        set_prefetched(
+            recipe,
+            'amount_ingredients',
+            related['amounts'].get(recipe.pk, []),
+        )
+    set_recipe_flags(recipes, user, related['flags'])
+    set_subscription_flags(
+        related['authors'].values(), user, related['followed']
+    )
+
+
+def get_view(viewset_class, request, action, kwargs=None):
+    return viewset_class(
+        request=request, action=action, args=(), kwargs=kwargs or {},
+        format_kwarg=None,
+    )
+
+
+def viewset_etag(viewset_class, action):
+    """ETag действия синхронного вьюсета"""
+    def get_etag(request, **kwargs):
+        return get_view(viewset_class, request, action, kwargs).get_etag()
+    return get_etag
+
+
+async def read_recipe_list(request):
+    view = get_view(RecipeViewSet, request, 'list')
+    page = await database_sync_to_async(lambda: list(view.paginate_queryset(
+        view.filter_queryset(Recipe.objects.all())
+    )))()
+    related = await load_related([recipe.pk for recipe in page], request.user)
+    attach_related(page, related, request.user)
+    return lambda: view.get_paginated_response(RecipeReadSerializer(
+        page, many=True, context={'request': request}
+    ).data).data
+
+
+async def read_recipe_detail(request, pk):
+    recipe, related = await asyncio.gather(
+        database_sync_to_async(Recipe.objects.filter(pk=pk).first)(),
+        load_related([pk], request.user),
+    )
+    if recipe is None:
+        raise NotFound()
+    attach_related([recipe], related, request.user)
+    return lambda: RecipeReadSerializer(
+        recipe, context={'request': request}
+    ).data
+
+
+async def read_tag_list(request):
+    tags = await database_sync_to_async(tags_cache.all)()
+    return lambda: TagSerializer(tags, many=True).data
+
+
+async def read_ingredient_list(request):
+    ingredients = await database_sync_to_async(search_ingredients)(
+        request.query_params
+    )
+    return lambda: ingredients
+
+
+async def read_subscriptions(request):
+    if not request.user.is_authenticated:
+        raise NotAuthenticated()
+    view = get_view(UserViewSet, request, 'subscriptions')
+    recipes_limit = get_recipes_limit({'request': request})
+    authors = await database_sync_to_async(lambda: list(
+        view.paginate_queryset(
+            view.get_subscriptions_queryset(request.user)
+        )
+    ))()
+    await database_sync_to_async(set_author_recipes)(authors, recipes_limit)
+    return lambda: view.get_paginated_response(SubscriptionSerializer(
+        authors, many=True, context={'request': request}
+    ).data).data
+
+
+recipe_list = async_read_view(
+    read_recipe_list,
+    RecipeViewSet.as_view({'get': 'list', 'post': 'create'}),
+    viewset_etag(RecipeViewSet, 'list'),
+)
+recipe_detail = async_read_view(
+    read_recipe_detail,
+    RecipeViewSet.as_view({
+        'get': 'retrieve',
+        'put': 'update',
+        'patch': 'partial_update',
+        'delete': 'destroy',
+    }),
+    viewset_etag(RecipeViewSet, 'retrieve'),
+)
+tag_list = async_read_view(
+    read_tag_list,
+    TagsViewSet.as_view({'get': 'list'}),
+    viewset_etag(TagsViewSet, 'list'),
+)
+ingredient_list = async_read_view(
+    read_ingredient_list,
+    IngredientsViewSet.as_view({'get': 'list'}),
+    viewset_etag(IngredientsViewSet, 'list'),
+)
+subscriptions = async_read_view(
+    read_subscriptions, UserViewSet.as_view({'get': 'subscriptions'})
+)
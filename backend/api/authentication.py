@@ -0,0 +1,69 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+TOKEN_CACHE_USER_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name',
+    'is_active', 'is_staff', 'is_superuser',
+)
+
+
+def get_token_cache_key(key):
+    return f'auth:token:{sha256(key.encode()).hexdigest()}'
+
+
+def forget_tokens(keys):
+    """Удаляет токены из кэша аутентификации"""
+    cache.delete_many([get_token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с пользователем из общего кэша.
+
+    В кэше TOKEN_CACHE_TIMEOUT секунд хранятся id и поля пользователя
+    из TOKEN_CACHE_USER_FIELDS, поэтому запрос к таблицам токенов
+    и пользователей выполняется только при промахе. Остальные поля,
+    в том числе хеш пароля, в кэш не попадают и загружаются из БД
+    при первом обращении. Сигналы удаляют запись при удалении токена
+    (выход) и при сохранении пользователя (смена пароля, деактивация).
+    Изменения в обход сигналов, например через QuerySet.update,
+    видны не позже чем через TOKEN_CACHE_TIMEOUT.
+    """
+    def authenticate_credentials(self, key):
+        cache_key = get_token_cache_key(key)
+        fields = cache.get(cache_key)
+        if fields is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            user = token.user
+            fields = {
+                field: getattr(user, field)
+                for field in TOKEN_CACHE_USER_FIELDS
+            }
+            cache.set(cache_key, fields, settings.TOKEN_CACHE_TIMEOUT)
+        else:
+            model = get_user_model()
+            # from_db ждёт значения в порядке полей модели
+            names = [
+                field.attname for field in model._meta.concrete_fields
+                if field.attname in fields
+            ]
+            user = model.from_db(
+                router.db_for_read(model), names,
+                [fields[name] for name in names],
+            )
+            token = self.get_model()(key=key, user=user)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return (user, token)
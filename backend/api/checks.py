@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Кэш по умолчанию должен быть общим для всех воркеров и хостов.
+
+    Через него отзываются токены, меняются версии справочников
+    и состояния пользователя для ETag. С локальным кэшем вышедший
+    пользователь остаётся авторизован на других хостах.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [Error(
+        f'Кэш {backend} не общий для воркеров и хостов.',
+        hint=(
+            'Укажите общий кэш в CACHE_BACKEND и CACHE_LOCATION, например '
+            'django.core.cache.backends.memcached.PyMemcacheCache.'
+        ),
+        id='api.E001',
+    )]
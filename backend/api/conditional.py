@@ -0,0 +1,128 @@
+import json
+from hashlib import sha256
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import (get_conditional_response, patch_vary_headers,
+                                quote_etag)
+from recipes.ingredient_index import ingredient_index
+from recipes.reference_cache import tags_cache
+
+CONDITIONAL_METHODS = ('GET', 'HEAD')
+
+
+def get_user_state_key(user_id):
+    return f'user-state:{user_id}:version'
+
+
+def get_user_state_version(user):
+    """Версия избранного, корзины и подписок пользователя"""
+    if user is None or not user.is_authenticated:
+        return None
+    key = get_user_state_key(user.pk)
+    cache.add(key, uuid4().hex, timeout=None)
+    return cache.get(key)
+
+
+def touch_user_state(user_id):
+    cache.set(get_user_state_key(user_id), uuid4().hex, timeout=None)
+
+
+def make_etag(*parts):
+    return quote_etag(sha256(
+        json.dumps(parts, default=str).encode()
+    ).hexdigest()[:32])
+
+
+def get_query_params(request):
+    return sorted(
+        (key, sorted(request.query_params.getlist(key)))
+        for key in request.query_params
+    )
+
+
+def recipes_etag(request, queryset, *parts):
+    """Валидатор ответа с рецептами из queryset.
+
+    Время последнего изменения и число рецептов считаются одним
+    агрегатным запросом. К ним добавляются параметры запроса,
+    версии справочников тегов и ингредиентов и версия
+    персональных флагов пользователя.
+    """
+    state = queryset.order_by().aggregate(
+        updated=Max('updated_at'), count=Count('pk')
+    )
+    user = request.user
+    return make_etag(
+        'recipes',
+        *parts,
+        state['updated'],
+        state['count'],
+        get_query_params(request),
+        tags_cache.get_shared_version(),
+        ingredient_index.get_shared_version(),
+        user.pk,
+        get_user_state_version(user),
+    )
+
+
+def reference_etag(request, reference_cache, *parts):
+    """Валидатор ответа со справочником: его версия и параметры запроса"""
+    return make_etag(
+        reference_cache.version_key,
+        *parts,
+        get_query_params(request),
+        reference_cache.get_shared_version(),
+    )
+
+
+def get_not_modified(request, etag):
+    """Ответ 304 или 412, если запрос условный и ответ не изменился"""
+    if etag is None or request.method not in CONDITIONAL_METHODS:
+        return None
+    return get_conditional_response(request, etag=etag)
+
+
+def set_validators(response, etag):
+    if etag is not None and response.status_code in (200, 304):
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+class NotModified(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """Условный GET: ETag и ответ 304 без сериализации.
+
+    Вьюсет задаёт get_etag() для текущего действия. Валидатор
+    считается после аутентификации, но до работы с данными,
+    и при совпадении с If-None-Match ответ возвращается сразу.
+    """
+    etag = None
+
+    def get_etag(self):
+        return None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in CONDITIONAL_METHODS:
+            self.etag = self.get_etag()
+        response = get_not_modified(request, self.etag)
+        if response is not None:
+            raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        return set_validators(response, self.etag)
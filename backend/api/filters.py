@@ -1,34 +1,53 @@
 from django_filters.rest_framework import FilterSet
-from django_filters.rest_framework.filters import (BooleanFilter, CharFilter,
-                                                   ModelMultipleChoiceFilter,
+from django_filters.rest_framework.filters import (BaseInFilter, BooleanFilter,
+                                                   CharFilter, ChoiceFilter,
+                                                   MultipleChoiceFilter,
                                                    NumberFilter)
-from recipes.models import Ingredients, Recipe, Tag
+from recipes.constants import TAGS_MODE_ALL, TAGS_MODE_ANY, TAGS_MODE_CHOICES
+from recipes.models import Recipe
+from recipes.reference_cache import tags_cache
 
 
-class IngredientFilter(FilterSet):
-    """Фильтр для поиска ингредиентов по названию"""
-    name = CharFilter(field_name='name', lookup_expr='istartswith')
+class NumberInFilter(BaseInFilter, NumberFilter):
+    """Список чисел через запятую"""
 
-    class Meta:
-        model = Ingredients
-        fields = ('name', 'measurement_unit')
+
+def get_tag_choices():
+    return [(tag.slug, tag.name) for tag in tags_cache.all()]
 
 
 class RecipeFilter(FilterSet):
     """"Фильтр для поиска и фильтрации рецептов по названию, автору и тегам"""
-    tags = ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug',
+    tags = MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='get_tags_filter',
+    )
+    tags_mode = ChoiceFilter(
+        choices=TAGS_MODE_CHOICES,
+        method='get_tags_mode_filter',
     )
     author = NumberFilter(field_name='author__id')
     is_favorited = BooleanFilter(method='get_favorite_filter')
     is_in_shopping_cart = BooleanFilter(method='get_shopping_cart_filter')
+    search = CharFilter(method='get_search_filter')
+    ingredients = NumberInFilter(method='get_ingredients_filter')
+    missing = NumberFilter(method='get_missing_filter', min_value=0)
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
+    def get_tags_filter(self, queryset, name, value):
+        if not value:
+            return queryset
+        tags = (tags_cache.get_by('slug', slug) for slug in value)
+        tag_ids = [tag.pk for tag in tags if tag is not None]
+        mode = self.form.cleaned_data.get('tags_mode') or TAGS_MODE_ANY
+        return queryset.with_tags(tag_ids, match_all=mode == TAGS_MODE_ALL)
+
+    def get_tags_mode_filter(self, queryset, name, value):
+        return queryset
+
     def get_favorite_filter(self, queryset, name, value):
         if self.request.user.is_authenticated:
             return queryset.filter(favorites__user=self.request.user)
@@ -38,3 +57,15 @@ class RecipeFilter(FilterSet):
         if self.request.user.is_authenticated:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+    def get_search_filter(self, queryset, name, value):
+        return queryset.search(value)
+
+    def get_ingredients_filter(self, queryset, name, value):
+        missing = self.form.cleaned_data.get('missing') or 0
+        return queryset.cookable_with(
+            [int(ingredient_id) for ingredient_id in value], int(missing)
+        )
+
+    def get_missing_filter(self, queryset, name, value):
+        return queryset
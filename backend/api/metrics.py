@@ -0,0 +1,402 @@
+import asyncio
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from uuid import uuid4
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from recipes.constants import METRICS_DURATION_BUCKETS, METRICS_QUERY_BUCKETS
+
+from .query_budget import QueryCounter
+
+HISTOGRAMS = {
+    'foodgram_request_duration_seconds': (
+        'Полное время обработки запроса', METRICS_DURATION_BUCKETS,
+    ),
+    'foodgram_request_db_duration_seconds': (
+        'Время запросов к БД', METRICS_DURATION_BUCKETS,
+    ),
+    'foodgram_request_serialize_duration_seconds': (
+        'Время сериализации и рендеринга ответа', METRICS_DURATION_BUCKETS,
+    ),
+    'foodgram_request_queries': (
+        'Число запросов к БД', METRICS_QUERY_BUCKETS,
+    ),
+}
+REQUESTS_COUNTER = 'foodgram_requests_total'
+ARCHIVE_NAME = 'archive.json'
+LOCK_NAME = 'archive.lock'
+LABEL_SEPARATOR = '\x1f'
+
+logger = logging.getLogger(__name__)
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class MetricsRegistry:
+    """Гистограммы запросов одного процесса.
+
+    Фоновый поток каждого воркера раз в METRICS_FLUSH_INTERVAL секунд
+    сохраняет снимок в файл в METRICS_DIR, а эндпоинт метрик складывает
+    снимки всех воркеров. Файл называется по pid и случайному id запуска,
+    поэтому новый воркер с тем же pid не затирает снимок старого.
+    Счётчики должны только расти, поэтому снимки завершившихся воркеров
+    (не обновлялись дольше METRICS_STALE_AFTER секунд) не удаляются,
+    а складываются в общий архив.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._histograms = {}
+        self._requests = {}
+        self._pid = None
+        self._instance = None
+        self._flusher = None
+
+    def observe(self, route, method, status, values):
+        labels = LABEL_SEPARATOR.join((route, method))
+        with self._lock:
+            self.start_flusher()
+            for name, value in values.items():
+                buckets = HISTOGRAMS[name][1]
+                key = LABEL_SEPARATOR.join((name, labels))
+                histogram = self._histograms.setdefault(key, {
+                    'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0,
+                })
+                index = bisect_left(buckets, value)
+                if index < len(buckets):
+                    histogram['buckets'][index] += 1
+                histogram['sum'] += value
+                histogram['count'] += 1
+            key = LABEL_SEPARATOR.join((labels, str(status)))
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def start_flusher(self):
+        """Запускает поток записи снимков, в том числе после fork.
+
+        Значения, унаследованные от родительского процесса, сбрасываются:
+        они уже есть в его снимке.
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        if self._pid is not None:
+            self._histograms, self._requests = {}, {}
+        self._pid, self._instance = pid, uuid4().hex
+        self._flusher = threading.Thread(
+            target=self.flush_periodically, name='metrics-flusher',
+            daemon=True,
+        )
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def flush_periodically(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                logger.exception('Не удалось сохранить снимок метрик')
+
+    def flush(self):
+        with self._lock:
+            # После fork снимок пишется только после первого запроса
+            if self._pid != os.getpid():
+                return
+            snapshot = json.dumps({
+                'histograms': self._histograms,
+                'requests': self._requests,
+            })
+            name = f'{self._pid}-{self._instance}.json'
+        with self._flush_lock:
+            write_snapshot(os.path.join(settings.METRICS_DIR, name), snapshot)
+
+    def compact(self, lock_file):
+        """Складывает снимки завершившихся воркеров в архив"""
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        stale_before = time.time() - settings.METRICS_STALE_AFTER
+        stale = [
+            path for path in snapshot_paths()
+            if os.path.basename(path) != ARCHIVE_NAME
+            and os.path.getmtime(path) < stale_before
+        ]
+        if not stale:
+            return
+        archive_path = os.path.join(settings.METRICS_DIR, ARCHIVE_NAME)
+        archive = empty_snapshot()
+        merge_snapshot(archive, read_snapshot(archive_path))
+        for path in stale:
+            merge_snapshot(archive, read_snapshot(path))
+        write_snapshot(archive_path, json.dumps(archive))
+        for path in stale:
+            os.remove(path)
+
+    def collect(self):
+        """Снимки всех воркеров и архив, сложенные вместе.
+
+        Архивация и чтение идут под блокировкой файла, иначе снимок
+        мог бы попасть в сумму дважды или ни разу.
+        """
+        self.flush()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        total = empty_snapshot()
+        lock_path = os.path.join(settings.METRICS_DIR, LOCK_NAME)
+        with open(lock_path, 'a') as lock_file:
+            self.compact(lock_file)
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            for path in snapshot_paths():
+                merge_snapshot(total, read_snapshot(path))
+        return total['histograms'], total['requests']
+
+
+def empty_snapshot():
+    return {'histograms': {}, 'requests': {}}
+
+
+def snapshot_paths():
+    return [
+        os.path.join(settings.METRICS_DIR, filename)
+        for filename in os.listdir(settings.METRICS_DIR)
+        if filename.endswith('.json')
+    ]
+
+
+def read_snapshot(path):
+    try:
+        with open(path) as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        return empty_snapshot()
+
+
+def write_snapshot(path, snapshot):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w') as snapshot_file:
+        snapshot_file.write(snapshot)
+    os.replace(temporary_path, path)
+
+
+def merge_snapshot(total, snapshot):
+    """Прибавляет снимок к сумме"""
+    for key, histogram in snapshot['histograms'].items():
+        summed = total['histograms'].setdefault(key, {
+            'buckets': [0] * len(histogram['buckets']),
+            'sum': 0.0, 'count': 0,
+        })
+        summed['buckets'] = [
+            left + right for left, right
+            in zip(summed['buckets'], histogram['buckets'])
+        ]
+        summed['sum'] += histogram['sum']
+        summed['count'] += histogram['count']
+    requests = total['requests']
+    for key, count in snapshot['requests'].items():
+        requests[key] = requests.get(key, 0) + count
+
+
+registry = MetricsRegistry()
+
+
+def format_labels(**labels):
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+         .replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return ','.join(f'{name}="{value}"' for name, value in escaped)
+
+
+def render_prometheus(histograms, requests):
+    """Метрики в текстовом формате Prometheus"""
+    lines = []
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} histogram')
+        for key in sorted(histograms):
+            metric, route, method = key.split(LABEL_SEPARATOR)
+            if metric != name:
+                continue
+            histogram = histograms[key]
+            cumulative = 0
+            for bound, count in zip(buckets, histogram['buckets']):
+                cumulative += count
+                labels = format_labels(route=route, method=method, le=bound)
+                lines.append(f'{name}_bucket{{{labels}}} {cumulative}')
+            labels = format_labels(route=route, method=method)
+            inf_labels = format_labels(route=route, method=method, le='+Inf')
+            lines.append(f'{name}_bucket{{{inf_labels}}} {histogram["count"]}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram["sum"]}')
+            lines.append(f'{name}_count{{{labels}}} {histogram["count"]}')
+    lines.append(f'# HELP {REQUESTS_COUNTER} Число обработанных запросов')
+    lines.append(f'# TYPE {REQUESTS_COUNTER} counter')
+    for key in sorted(requests):
+        route, method, status = key.split(LABEL_SEPARATOR)
+        labels = format_labels(route=route, method=method, status=status)
+        lines.append(f'{REQUESTS_COUNTER}{{{labels}}} {requests[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Эндпоинт для Prometheus"""
+    return HttpResponse(
+        render_prometheus(*registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+def count_request_queries(execute, sql, params, many, context):
+    """Передаёт запрос к БД счётчику текущего HTTP-запроса.
+
+    Счётчик ищется в контекстной переменной, поэтому учитываются
+    и запросы из потоков, в которых sync_to_async выполняет
+    синхронный код асинхронных вьюх.
+    """
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.queries(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    if count_request_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_request_queries)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = QueryCounter()
+        self.view_started = None
+        self.view_db = 0.0
+        self.serialize = 0.0
+        self.render_started = None
+
+
+class MetricsMiddleware:
+    """Время обработки запроса по маршрутам DRF.
+
+    Считает полное время, время и число запросов к БД и время
+    сериализации. Сериализацией считается работа вьюхи без запросов
+    к БД (для чтения это в основном сериализаторы) плюс рендеринг
+    ответа. Значения отдаются заголовком Server-Timing и копятся
+    в гистограммах для эндпоинта метрик. Поддерживает и асинхронную
+    цепочку middleware, чтобы под ASGI не занимать поток на запрос.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.acall(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        timings = request.metrics_timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.process_response(request, response, timings)
+
+    async def acall(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        timings = request.metrics_timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.process_response(request, response, timings)
+
+    def process_response(self, request, response, timings):
+        if response.streaming:
+            response['Server-Timing'] = self.server_timing(timings)
+            response.streaming_content = self.wrap_streaming(
+                request, response, timings, response.streaming_content
+            )
+        else:
+            response['Server-Timing'] = self.finish(
+                request, response, timings
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(request, 'metrics_timings', None)
+        if timings is not None:
+            timings.view_started = time.perf_counter()
+            timings.view_db = timings.queries.duration
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, 'metrics_timings', None)
+        if timings is None or timings.view_started is None:
+            return response
+        now = time.perf_counter()
+        view_db = timings.queries.duration - timings.view_db
+        timings.serialize = max(now - timings.view_started - view_db, 0.0)
+        timings.render_started = now
+        response.add_post_render_callback(
+            lambda rendered: self.rendered(timings)
+        )
+        return response
+
+    def rendered(self, timings):
+        timings.serialize += time.perf_counter() - timings.render_started
+
+    def wrap_streaming(self, request, response, timings, content):
+        current_timings.set(timings)
+        try:
+            yield from content
+        finally:
+            current_timings.set(None)
+            self.finish(request, response, timings)
+
+    def server_timing(self, timings):
+        total = time.perf_counter() - timings.started
+        db = timings.queries.duration
+        app = max(total - db - timings.serialize, 0.0)
+        return (
+            f'db;dur={db * 1000:.1f};desc="{timings.queries.count} queries", '
+            f'serialize;dur={timings.serialize * 1000:.1f}, '
+            f'app;dur={app * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+
+    def finish(self, request, response, timings):
+        header = self.server_timing(timings)
+        match = request.resolver_match
+        registry.observe(
+            match.url_name if match and match.url_name else 'unmatched',
+            request.method,
+            response.status_code,
+            {
+                'foodgram_request_duration_seconds': (
+                    time.perf_counter() - timings.started
+                ),
+                'foodgram_request_db_duration_seconds': (
+                    timings.queries.duration
+                ),
+                'foodgram_request_serialize_duration_seconds': (
+                    timings.serialize
+                ),
+                'foodgram_request_queries': timings.queries.count,
+            },
+        )
+        return header
@@ -1,8 +1,187 @@
-from recipes.constants import PAGE_LIMIT_SIZE
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from datetime import datetime
+from hashlib import sha256
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from recipes.constants import CURSOR_FILTER_HASH_LENGTH, PAGE_LIMIT_SIZE
+from recipes.models import FeedEntry
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination:
+    """Пагинация по курсору без COUNT и OFFSET.
+
+    Страница выбирается условием по полям сортировки последней
+    записи предыдущей страницы, поэтому время ответа не зависит
+    от её номера. В курсор записываются значения этих полей
+    и отпечаток параметров фильтрации. Даты сохраняются
+    с микросекундами, иначе записи с близким временем терялись бы.
+    """
+    cursor_query_param = 'cursor'
+    ignored_query_params = ('cursor', 'page', 'limit')
+
+    def __init__(self, ordering, page_size):
+        self.ordering = ordering
+        self.page_size = page_size
+
+    def get_filters_hash(self, request):
+        params = sorted(
+            (key, sorted(request.query_params.getlist(key)))
+            for key in request.query_params
+            if key not in self.ignored_query_params
+        )
+        return sha256(
+            json.dumps(params).encode()
+        ).hexdigest()[:CURSOR_FILTER_HASH_LENGTH]
+
+    def encode_cursor(self, obj):
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            values.append(value)
+        data = json.dumps({'p': values, 'f': self.filters_hash})
+        return urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor, model):
+        try:
+            data = json.loads(urlsafe_b64decode(
+                cursor + '=' * (-len(cursor) % 4)
+            ))
+            values = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, data['p'])
+            ]
+            filters_hash = data['f']
+        except (BinasciiError, DjangoValidationError, KeyError, TypeError,
+                ValueError):
+            raise ValidationError({'cursor': 'Некорректный курсор.'})
+        if len(values) != len(self.ordering) or None in values:
+            raise ValidationError({'cursor': 'Некорректный курсор.'})
+        if filters_hash != self.filters_hash:
+            raise ValidationError(
+                {'cursor': 'Курсор получен для других параметров фильтра.'}
+            )
+        return values
+
+    def get_keyset_filter(self, values):
+        condition = Q()
+        for index in reversed(range(len(self.ordering))):
+            field = self.ordering[index]
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {
+                other.lstrip('-'): value
+                for other, value in zip(self.ordering[:index], values)
+            }
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[index]})
+        return condition
+
+    def check_ordering(self, queryset):
+        """Курсор строится только по своему порядку.
+
+        Если фильтр уже задал другой порядок (релевантность поиска,
+        доля имеющихся ингредиентов), заменять его нельзя: с курсором
+        и без него выдача шла бы в разном порядке.
+        """
+        ordering = tuple(queryset.query.order_by)
+        if ordering and ordering != tuple(self.ordering):
+            raise ValidationError({
+                'cursor': 'Курсор нельзя использовать с сортировкой '
+                          'по релевантности, нужна постраничная выдача.'
+            })
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        self.filters_hash = self.get_filters_hash(request)
+        self.check_ordering(queryset)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.get_keyset_filter(
+                self.decode_cursor(cursor, queryset.model)
+            ))
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
+
+
+class FeedPagination(KeysetPagination):
+    """Пагинация ленты по курсору.
+
+    Порядок страницы задаёт FeedEntry.objects.page_keys, а рецепты
+    со связанными объектами загружаются одним запросом по их id.
+    """
+    def __init__(self, page_size):
+        super().__init__(('-pub_date', '-id'), page_size)
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        self.filters_hash = self.get_filters_hash(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        before = None
+        if cursor:
+            before = self.decode_cursor(cursor, queryset.model)
+        keys = FeedEntry.objects.page_keys(
+            request.user, before, self.page_size + 1
+        )
+        self.has_next = len(keys) > self.page_size
+        recipe_ids = [recipe_id for _, recipe_id in keys[:self.page_size]]
+        recipes = queryset.in_bulk(recipe_ids)
+        self.page = [
+            recipes[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ]
+        return self.page
 
 
 class CustomPagination(PageNumberPagination):
-    """Кастомная пагинация"""
+    """Кастомная пагинация.
+
+    По умолчанию постраничная. Если в запросе есть параметр cursor
+    (пустой для первой страницы), а у действия вьюсета задан порядок
+    в cursor_ordering, используется пагинация по курсору.
+    """
     page_size_query_param = 'limit'
     page_size = PAGE_LIMIT_SIZE
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', {}).get(
+            getattr(view, 'action', None)
+        )
+        if (ordering is None
+                or KeysetPagination.cursor_query_param
+                not in request.query_params):
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = KeysetPagination(ordering, self.get_page_size(request))
+        return self.keyset.paginate_queryset(queryset, request)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
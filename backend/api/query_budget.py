@@ -0,0 +1,64 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Действие вьюсета выполнило больше запросов, чем разрешено"""
+
+
+class QueryCounter:
+    """Считает запросы к БД и суммарное время их выполнения.
+
+    Запросы одного HTTP-запроса могут идти из нескольких потоков,
+    поэтому счётчик обновляется под блокировкой.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.duration += duration
+                self.count += 1
+
+
+class QueryBudgetMixin:
+    """Контроль числа запросов к БД для действий вьюсета.
+
+    Бюджет задаётся словарём query_budget вида {действие: число запросов}
+    и включает запрос аутентификации. При превышении пишется
+    предупреждение в лог, а при QUERY_BUDGET_STRICT = True
+    выбрасывается QueryBudgetExceeded, что роняет тесты.
+    """
+    query_budget = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+        self.check_query_budget(counter.count)
+        return response
+
+    def check_query_budget(self, count):
+        budget = self.query_budget.get(getattr(self, 'action', None))
+        if budget is None or count <= budget:
+            return
+        message = (
+            f'{self.__class__.__name__}.{self.action}: '
+            f'{count} запросов при бюджете {budget}'
+        )
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
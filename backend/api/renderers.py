@@ -0,0 +1,131 @@
+import csv
+import json
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+from reportlab.pdfgen.canvas import Canvas
+from rest_framework.renderers import BaseRenderer
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+PDF_SPOOL_SIZE = 1024 * 1024
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+    def write(self, value):
+        return value
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Через render() выводятся только ошибки, сам список
+    отдаётся потоком через stream().
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    def stream(self, rows, group_by_unit=False):
+        raise NotImplementedError
+
+
+class TextShoppingCartRenderer(ShoppingCartRenderer):
+    """Список покупок в виде текстового файла"""
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows, group_by_unit=False):
+        yield 'Список покупок\n\n'
+        unit = None
+        for row in rows:
+            if group_by_unit and row['measurement_unit'] != unit:
+                unit = row['measurement_unit']
+                yield f'\n{unit}:\n'
+            yield (
+                f'{row["name"]} - {row["total"]} '
+                f'{row["measurement_unit"]}\n'
+            )
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+    """Список покупок в формате CSV"""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows, group_by_unit=False):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('Ингредиент', 'Количество', 'Единица'))
+        for row in rows:
+            yield writer.writerow(
+                (row['name'], row['total'], row['measurement_unit'])
+            )
+
+
+class PDFShoppingCartRenderer(ShoppingCartRenderer):
+    """Список покупок в формате PDF, разбитый на страницы.
+
+    PDF нельзя отдать до конца построения документа, поэтому
+    страницы пишутся во временный файл, который затем отдаётся кусками.
+    """
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingCartFont'
+    font_size = 12
+    line_height = 18
+    margin = 50
+
+    def get_font(self):
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return self.font_name
+        try:
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_CART_PDF_FONT)
+            )
+        except (TTFError, OSError):
+            return 'Helvetica'
+        return self.font_name
+
+    def stream(self, rows, group_by_unit=False):
+        font = self.get_font()
+        width, height = A4
+        with SpooledTemporaryFile(max_size=PDF_SPOOL_SIZE) as output:
+            canvas = Canvas(output, pagesize=A4)
+            canvas.setTitle('Список покупок')
+            top = height - self.margin
+            y = top
+
+            def write_line(text):
+                nonlocal y
+                if y < self.margin:
+                    canvas.showPage()
+                    y = top
+                canvas.setFont(font, self.font_size)
+                canvas.drawString(self.margin, y, text)
+                y -= self.line_height
+
+            write_line('Список покупок')
+            unit = None
+            for row in rows:
+                if group_by_unit and row['measurement_unit'] != unit:
+                    unit = row['measurement_unit']
+                    y -= self.line_height / 2
+                    write_line(f'{unit}:')
+                write_line(
+                    f'{row["name"]} - {row["total"]} '
+                    f'{row["measurement_unit"]}'
+                )
+            canvas.save()
+            output.seek(0)
+            while True:
+                chunk = output.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
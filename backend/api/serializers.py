@@ -1,10 +1,33 @@
+from django.db import models, transaction
 from drf_extra_fields.fields import Base64ImageField
+from recipes.constants import BULK_RECIPES_MAX_LENGTH
+from recipes.derived import recipe_amounts_changed, recipe_ingredients_changed
+from recipes.images import process_upload
 from recipes.models import (Favorites, IngredientAmount, Ingredients, Recipe,
                             ShoppingCart, Tag)
+from recipes.reference_cache import tags_cache
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
 from users.models import Subscriber, User
-from users.serializers import UsersSerializer
+from users.serializers import (UsersListSerializer, UsersSerializer,
+                               set_subscription_flags)
+
+
+class ReferencePrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Связь по pk, которая ищет объект в справочнике в памяти процесса.
+
+    В БД обращается, только если объекта ещё нет в справочнике.
+    """
+    def __init__(self, reference_cache, **kwargs):
+        self.reference_cache = reference_cache
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, int) and not isinstance(data, bool):
+            obj = self.reference_cache.get(data)
+            if obj is not None:
+                return obj
+        return super().to_internal_value(data)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -44,6 +67,64 @@ class IngredientAmountCreateSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount',)
 
 
+def get_request_user(context):
+    """Пользователь из запроса в контексте сериализатора"""
+    request = context.get('request')
+    return getattr(request, 'user', None)
+
+
+def get_recipe_flags(recipe_ids, user):
+    """Флаги избранного и корзины пользователя по id рецептов"""
+    if user is None or not user.is_authenticated:
+        return {}
+    return {
+        pk: (is_favorited, is_in_shopping_cart)
+        for pk, is_favorited, is_in_shopping_cart
+        in Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).with_user_flags(user).values_list(
+            'pk', 'is_favorited', 'is_in_shopping_cart'
+        ).order_by()
+    }
+
+
+def set_recipe_flags(recipes, user, flags=None):
+    """Проставляет рецептам флаги избранного и корзины одним запросом.
+
+    Рецепты, у которых флаги уже есть (аннотация из вьюсета),
+    повторно не запрашиваются. Уже загруженные флаги можно
+    передать в flags.
+    """
+    missing = [
+        recipe for recipe in recipes
+        if not hasattr(recipe, 'is_favorited')
+    ]
+    if not missing:
+        return
+    if flags is None:
+        flags = get_recipe_flags([recipe.pk for recipe in missing], user)
+    for recipe in missing:
+        recipe.is_favorited, recipe.is_in_shopping_cart = flags.get(
+            recipe.pk, (False, False)
+        )
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов с флагами пользователя, вычисленными на всю страницу"""
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        recipes = list(recipes)
+        user = get_request_user(self.context)
+        if 'is_favorited' in self.child.fields:
+            set_recipe_flags(recipes, user)
+        if 'author' in self.child.fields:
+            set_subscription_flags(
+                [recipe.author for recipe in recipes if recipe.author],
+                user
+            )
+        return super().to_representation(recipes)
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     """Сериализатор для получения рецепта"""
     tags = TagSerializer(many=True)
@@ -60,27 +141,28 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'tags',
             'author', 'ingredients',
-            'image', 'is_favorited',
+            'image', 'image_thumbnail',
+            'image_card', 'is_favorited',
             'is_in_shopping_cart', 'cooking_time',
             'name', 'text',
         )
+        list_serializer_class = RecipeListSerializer
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        return False if user.is_anonymous else Favorites.objects.filter(
-            recipe=obj).exists()
+        set_recipe_flags([obj], get_request_user(self.context))
+        return obj.is_favorited
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return False if user.is_anonymous else ShoppingCart.objects.filter(
-            recipe=obj).exists()
+        set_recipe_flags([obj], get_request_user(self.context))
+        return obj.is_in_shopping_cart
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецепта"""
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = ReferencePrimaryKeyRelatedField(
         many=True,
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        reference_cache=tags_cache,
     )
     ingredients = IngredientAmountCreateSerializer(many=True)
     image = Base64ImageField(required=True)
@@ -99,23 +181,15 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     def validate_ingredients(self, value):
         if not value:
             raise serializers.ValidationError('Нужен минимум 1 ингредиент')
-        ingredients_list = []
-        for item in value:
-            try:
-                ingredient = Ingredients.objects.get(id=item['id'])
-            except Ingredients.DoesNotExist:
-                raise serializers.ValidationError(
-                    'Такого ингредиента не существует'
-                )
-            if ingredient in ingredients_list:
-                raise serializers.ValidationError(
-                    'Ингредиенты не могут повторяться!'
-                )
-            if int(item['amount']) <= 0:
-                raise serializers.ValidationError(
-                    'Количество ингредиента не дожно быть меньше нуля'
-                )
-            ingredients_list.append(ingredient)
+        ids = [item['id'] for item in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты не могут повторяться!'
+            )
+        if Ingredients.objects.filter(id__in=ids).count() != len(ids):
+            raise serializers.ValidationError(
+                'Такого ингредиента не существует'
+            )
         return value
 
     def validate_tags(self, value):
@@ -142,43 +216,105 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     def create_ingredients(self, ingredients, recipe):
         ingredient_list = []
         for ingredient in ingredients:
-            ingredient_instance = Ingredients.objects.get(id=ingredient['id'])
             ingredient_list.append(
                 IngredientAmount(
                     amount=ingredient['amount'],
-                    ingredient=ingredient_instance,
+                    ingredient_id=ingredient['id'],
                     recipe=recipe,
                 )
             )
         IngredientAmount.objects.bulk_create(ingredient_list)
 
+    def update_ingredients(self, ingredients, recipe):
+        """Приводит ингредиенты рецепта к новому списку.
+
+        Изменяет только отличающиеся строки. Возвращает изменения
+        количеств в формате get_deltas() и признак того, что
+        изменился сам набор ингредиентов.
+        """
+        existing = {
+            amount.ingredient_id: amount
+            for amount in recipe.amount_ingredients.all()
+        }
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        to_delete = existing.keys() - amounts.keys()
+        to_create = [
+            IngredientAmount(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ]
+        deltas = {
+            (recipe.pk, ingredient_id): -existing[ingredient_id].amount
+            for ingredient_id in to_delete
+        }
+        deltas.update(
+            ((recipe.pk, amount.ingredient_id), amount.amount)
+            for amount in to_create
+        )
+        to_update = []
+        for ingredient_id, amount in amounts.items():
+            current = existing.get(ingredient_id)
+            if current is not None and current.amount != amount:
+                deltas[recipe.pk, ingredient_id] = amount - current.amount
+                current.amount = amount
+                to_update.append(current)
+        if to_delete:
+            IngredientAmount.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=to_delete,
+            ).delete()
+        if to_create:
+            IngredientAmount.objects.bulk_create(to_create)
+        if to_update:
+            IngredientAmount.objects.bulk_update(to_update, ('amount',))
+        return deltas, bool(to_delete or to_create)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients', [])
         tags_data = validated_data.pop('tags', [])
+        validated_data.update(process_upload(validated_data['image']))
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags_data)
         self.create_ingredients(ingredients=ingredients_data, recipe=recipe)
+        # Нового рецепта ещё нет ни в одной корзине
+        recipe_ingredients_changed([recipe.pk], {})
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        if 'ingredients' not in validated_data:
-            raise serializers.ValidationError(
-                'Ингредиенты обязательны к заполнению!'
-            )
-        ingredients = validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        self.create_ingredients(ingredients, instance)
-        if 'tags' not in validated_data:
-            raise serializers.ValidationError(
-                'Теги обязательны к заполнению!'
-            )
-        instance.tags.set(validated_data.pop('tags'))
-        return super().update(instance, validated_data)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        deltas, ingredients_changed = (
+            self.update_ingredients(ingredients, instance)
+            if ingredients is not None else ({}, False)
+        )
+        if tags is not None:
+            instance.tags.set(tags)
+        if 'image' in validated_data:
+            validated_data.update(process_upload(validated_data['image']))
+        instance = super().update(instance, validated_data)
+        if ingredients_changed:
+            recipe_ingredients_changed([instance.pk], deltas)
+            return instance
+        if deltas:
+            recipe_amounts_changed([instance.pk], deltas)
+        if 'text' in validated_data:
+            Recipe.objects.filter(pk=instance.pk).update_computed_fields()
+        return instance
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
-        return RecipeReadSerializer(instance,
+        recipes = Recipe.objects.with_related()
+        user = get_request_user(self.context)
+        if user is not None and user.is_authenticated:
+            recipes = recipes.with_user_flags(user)
+        return RecipeReadSerializer(recipes.get(pk=instance.pk),
                                     context=context).data
 
 
@@ -194,23 +330,71 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         fields = ('user', 'recipe',)
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пачечного изменения избранного и корзины"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_RECIPES_MAX_LENGTH,
+    )
+
+
 class MiniRecipeSerializer(RecipeReadSerializer):
     image = Base64ImageField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_thumbnail', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
+
+
+def get_recipes_limit(context):
+    """Значение recipes_limit из запроса или None, если лимит не задан"""
+    request = context.get('request')
+    if request is None or 'recipes_limit' not in request.query_params:
+        return None
+    try:
+        recipes_limit = int(request.query_params['recipes_limit'])
+    except ValueError:
+        recipes_limit = -1
+    if recipes_limit < 0:
+        raise ValidationError(
+            {'recipes_limit': 'Должно быть неотрицательным целым числом'}
+        )
+    return recipes_limit
+
+
+def set_author_recipes(authors, recipes_limit):
+    """Загружает последние рецепты всех авторов страницы одним запросом"""
+    missing = [
+        author for author in authors
+        if not hasattr(author, 'limited_recipes')
+    ]
+    if not missing:
+        return
+    recipes = Recipe.objects.filter(
+        author__in=[author.pk for author in missing]
+    )
+    if recipes_limit is not None:
+        recipes = recipes.limited_per_author(recipes_limit)
+    recipes_by_author = {}
+    for recipe in recipes:
+        recipes_by_author.setdefault(recipe.author_id, []).append(recipe)
+    for author in missing:
+        author.limited_recipes = recipes_by_author.get(author.pk, [])
+
+
+class SubscriptionListSerializer(UsersListSerializer):
+    """Список подписок с рецептами авторов, загруженными на всю страницу"""
+    def to_representation(self, data):
+        authors = data.all() if isinstance(data, models.Manager) else data
+        authors = list(authors)
+        set_author_recipes(authors, get_recipes_limit(self.context))
+        return super().to_representation(authors)
 
 
 class SubscriberSerializer(serializers.ModelSerializer):
     """Сериализатор управления подписками"""
-    first_name = serializers.ReadOnlyField(source='author.first_name')
-    last_name = serializers.ReadOnlyField(source='author.last_name')
-    username = serializers.ReadOnlyField(source='author.username')
-    email = serializers.ReadOnlyField(source='author.email')
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
-    is_subscribed = serializers.SerializerMethodField()
     author = serializers.PrimaryKeyRelatedField(
         write_only=True,
         queryset=User.objects.all()
@@ -218,13 +402,7 @@ class SubscriberSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Subscriber
-        fields = (
-            'id', 'first_name',
-            'last_name', 'username',
-            'email', 'recipes',
-            'recipes_count', 'is_subscribed',
-            'author',
-        )
+        fields = ('author',)
 
     def validate(self, data):
         user = self.context['request'].user
@@ -232,11 +410,6 @@ class SubscriberSerializer(serializers.ModelSerializer):
 
         if user == author_to_sub:
             raise ValidationError('Нельзя подписаться на самого себя!')
-        if Subscriber.objects.filter(
-            author=user,
-            subscriber=author_to_sub
-        ).exists():
-            raise ValidationError('Вы уже подписались на этого пользователя!')
         return data
 
     def create(self, validated_data):
@@ -247,34 +420,18 @@ class SubscriberSerializer(serializers.ModelSerializer):
             subscriber=author_to_sub
         )
         if not created:
-            raise ValidationError('Подписка уже существует')
+            raise ValidationError('Вы уже подписались на этого пользователя!')
         return subs
 
-    def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return Subscriber.objects.filter(
-            author=obj.author,
-            subscriber=user
-        ).exists()
-
-    def get_recipes(self, obj):
-        if 'recipes_limit' in self.context['request'].query_params:
-            recipes_limit = int(self.context['request'].
-                                query_params['recipes_limit'])
-            queryset = obj.author.recipes.all()[:recipes_limit]
-            return MiniRecipeSerializer(queryset, many=True).data
-        queryset = obj.author.recipes.all()
-        return MiniRecipeSerializer(queryset, many=True).data
-
-    def get_recipes_count(self, obj):
-        return obj.author.recipes.all().count()
+    def to_representation(self, instance):
+        author = User.objects.get(pk=instance.subscriber_id)
+        author.is_subscribed = True
+        return SubscriptionSerializer(author, context=self.context).data
 
 
 class SubscriptionSerializer(UsersSerializer):
     """Сериализатор для эндпоинта subscription"""
-    is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -284,26 +441,11 @@ class SubscriptionSerializer(UsersSerializer):
             'last_name', 'is_subscribed',
             'recipes', 'recipes_count',
         )
-
-    def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Subscriber.objects.filter(
-            subscriber=user,
-            author=obj.id).exists()
+        list_serializer_class = SubscriptionListSerializer
 
     def get_recipes(self, obj):
-        if 'recipes_limit' in self.context['request'].query_params:
-            recipes_limit = int(self.context['request'].
-                                query_params['recipes_limit'])
-            queryset = obj.recipes.all()[:recipes_limit]
-            return MiniRecipeSerializer(queryset, many=True).data
-        queryset = obj.recipes.all()
-        return MiniRecipeSerializer(queryset, many=True).data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.all().count()
+        set_author_recipes([obj], get_recipes_limit(self.context))
+        return MiniRecipeSerializer(obj.limited_recipes, many=True).data
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
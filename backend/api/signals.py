@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import Favorites, ShoppingCart
+from rest_framework.authtoken.models import Token
+from users.models import Subscriber, User
+
+from .authentication import forget_tokens
+from .conditional import touch_user_state
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    # После delete() первичный ключ экземпляра, то есть key, обнуляется
+    key = instance.key
+    transaction.on_commit(lambda: forget_tokens([key]))
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, **kwargs):
+    if created:
+        return
+    keys = list(Token.objects.filter(
+        user=instance
+    ).values_list('key', flat=True))
+    if keys:
+        transaction.on_commit(lambda: forget_tokens(keys))
+
+
+@receiver(post_save, sender=Favorites)
+@receiver(post_delete, sender=Favorites)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def touch_recipe_flags(sender, instance, **kwargs):
+    transaction.on_commit(lambda: touch_user_state(instance.user_id))
+
+
+@receiver(post_save, sender=Subscriber)
+@receiver(post_delete, sender=Subscriber)
+def touch_subscription_flags(sender, instance, **kwargs):
+    transaction.on_commit(lambda: touch_user_state(instance.author_id))
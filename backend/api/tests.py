@@ -0,0 +1,522 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from recipes.derived import get_amounts, get_deltas, recipe_ingredients_changed
+from recipes.models import (Favorites, FeedEntry, IngredientAmount,
+                            Ingredients, Recipe, ShoppingCart,
+                            ShoppingListItem)
+from recipes.sample_data import create_sample_data
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from users.models import User
+
+from .authentication import get_token_cache_key
+from .utils import (RECIPE_ADDED, RECIPE_NOT_FOUND, RECIPE_REMOVED,
+                    RECIPE_UNCHANGED)
+from .views import RecipeViewSet
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+PAGE_SIZES = (2, 6)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, CACHES=TEST_CACHES)
+class QueryBudgetTests(APITestCase):
+    """Число запросов не зависит от размера страницы.
+
+    Бюджеты вьюсетов проверяются в строгом режиме: превышение
+    выбрасывает QueryBudgetExceeded и роняет тест.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        create_sample_data(
+            users=10, recipes=60, ingredients=40, favorites_per_user=5,
+            cart_per_user=3, subscriptions_per_user=4,
+        )
+        cls.user = User.objects.order_by('id').first()
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(context.captured_queries)
+
+    def assert_same_queries(self, url, params_list):
+        # Первый запрос заполняет кэши процесса
+        self.count_queries(url, params_list[0])
+        counts = {
+            str(params): self.count_queries(url, params)
+            for params in params_list
+        }
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def page_sizes(self, **params):
+        return [{**params, 'limit': limit} for limit in PAGE_SIZES]
+
+    def test_recipe_list(self):
+        self.assert_same_queries('/api/recipes/', self.page_sizes())
+
+    def test_recipe_list_cursor(self):
+        self.assert_same_queries(
+            '/api/recipes/', self.page_sizes(cursor='')
+        )
+
+    def test_recipe_list_filtered(self):
+        self.assert_same_queries(
+            '/api/recipes/',
+            self.page_sizes(is_favorited=1, is_in_shopping_cart=1),
+        )
+
+    def test_recipe_detail(self):
+        small, large = Recipe.objects.order_by('id')[:2]
+        old_amounts = get_amounts([small.pk])
+        IngredientAmount.objects.filter(recipe=small).exclude(
+            pk=small.amount_ingredients.order_by('id').first().pk
+        ).delete()
+        recipe_ingredients_changed(
+            [small.pk], get_deltas(old_amounts, get_amounts([small.pk]))
+        )
+        self.count_queries(f'/api/recipes/{small.id}/')
+        self.assertEqual(
+            self.count_queries(f'/api/recipes/{small.id}/'),
+            self.count_queries(f'/api/recipes/{large.id}/'),
+        )
+
+    def test_recipe_update(self):
+        recipe = Recipe.objects.filter(author=self.user).first()
+        ingredients = [
+            {'id': amount.ingredient_id, 'amount': amount.amount}
+            for amount in recipe.amount_ingredients.order_by('id')
+        ]
+        # Меняется количество, один ингредиент заменяется другим
+        ingredients[0]['amount'] += 1
+        ingredients[-1]['id'] = Ingredients.objects.exclude(
+            amount_ingredients__recipe=recipe
+        ).values_list('id', flat=True).first()
+        self.count_queries(f'/api/recipes/{recipe.id}/')
+        with self.assertNumQueries(
+            RecipeViewSet.query_budget['partial_update']
+        ):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/',
+                {'ingredients': ingredients}, format='json',
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_feed(self):
+        self.assert_same_queries('/api/recipes/feed/', self.page_sizes())
+
+    def test_user_list(self):
+        self.assert_same_queries('/api/users/', self.page_sizes())
+
+    def test_subscriptions(self):
+        self.assert_same_queries(
+            '/api/users/subscriptions/',
+            self.page_sizes() + self.page_sizes(recipes_limit=1),
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KeysetPaginationTests(APITestCase):
+    """Курсор не подменяет порядок, заданный фильтром"""
+    @classmethod
+    def setUpTestData(cls):
+        create_sample_data(users=3, recipes=10, ingredients=10)
+
+    def test_cursor_keeps_default_ordering(self):
+        response = self.client.get('/api/recipes/', {'cursor': '', 'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            list(Recipe.objects.order_by(
+                '-pub_date', '-id'
+            ).values_list('id', flat=True)[:3]),
+        )
+
+    def test_cursor_rejected_for_ranked_filters(self):
+        ingredient_id = IngredientAmount.objects.values_list(
+            'ingredient', flat=True
+        ).first()
+        for params in ({'search': 'рецепт'}, {'ingredients': ingredient_id}):
+            with self.subTest(params):
+                response = self.client.get(
+                    '/api/recipes/', {**params, 'cursor': ''}
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.data)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ShoppingListTests(APITestCase):
+    """Списки покупок правятся вместе с составом рецептов"""
+    @classmethod
+    def setUpTestData(cls):
+        create_sample_data(users=4, recipes=6, ingredients=30)
+        cls.recipe, cls.other = Recipe.objects.order_by('id')[:2]
+        cls.author = cls.recipe.author
+        for user in User.objects.all():
+            ShoppingCart.objects.get_or_create(user=user, recipe=cls.recipe)
+            ShoppingCart.objects.get_or_create(user=user, recipe=cls.other)
+        ShoppingListItem.objects.refresh(User.objects.values('id'))
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def get_totals(self):
+        return {
+            (item.user_id, item.ingredient_id): item.total
+            for item in ShoppingListItem.objects.all()
+        }
+
+    def get_expected_totals(self):
+        return {
+            (row['user'], row['ingredient']): row['total']
+            for row in ShoppingListItem.objects.expected_totals(
+                User.objects.values('id')
+            )
+        }
+
+    def test_totals_after_ingredients_edit(self):
+        amounts = list(self.recipe.amount_ingredients.order_by('id'))
+        shared = self.other.amount_ingredients.exclude(
+            ingredient__in=[amount.ingredient_id for amount in amounts]
+        ).first()
+        new = Ingredients.objects.exclude(
+            amount_ingredients__recipe__in=[self.recipe, self.other]
+        ).first()
+        ingredients = [
+            {'id': amounts[0].ingredient_id, 'amount': amounts[0].amount + 5},
+            {'id': shared.ingredient_id, 'amount': 7},
+            {'id': new.id, 'amount': 3},
+        ]
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            {'ingredients': ingredients}, format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.get_totals(), self.get_expected_totals())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkRecipesTests(APITestCase):
+    """Пачечное изменение избранного и корзины"""
+    @classmethod
+    def setUpTestData(cls):
+        create_sample_data(
+            users=3, recipes=12, ingredients=20, favorites_per_user=0,
+            cart_per_user=0, subscriptions_per_user=0,
+        )
+        cls.user = User.objects.order_by('id').first()
+        cls.recipe_ids = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)
+        )
+        cls.missing_id = cls.recipe_ids[-1] + 100
+        # Другой пользователь уже держит рецепты: счётчики не с нуля
+        other = User.objects.exclude(pk=cls.user.pk).first()
+        for model in (Favorites, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=other, recipe_id=recipe_id)
+                for recipe_id in cls.recipe_ids[:2]
+            )
+        Recipe.objects.filter(pk__in=cls.recipe_ids[:2]).update(
+            favorites_count=1, in_carts_count=1
+        )
+        ShoppingListItem.objects.refresh([other.pk])
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def change(self, method, url, recipe_ids):
+        response = getattr(self.client, method)(
+            f'/api/recipes/{url}/', {'recipes': recipe_ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return {
+            row['id']: row['status'] for row in response.data['recipes']
+        }
+
+    def get_counters(self, field):
+        return dict(Recipe.objects.values_list('id', field))
+
+    def assert_shopping_list(self):
+        self.assertEqual(
+            {
+                (item.user_id, item.ingredient_id): item.total
+                for item in ShoppingListItem.objects.all()
+            },
+            {
+                (row['user'], row['ingredient']): row['total']
+                for row in ShoppingListItem.objects.expected_totals(
+                    User.objects.values('id')
+                )
+            },
+        )
+
+    def test_mixed_batches(self):
+        first, second, third = self.recipe_ids[:3]
+        for url, model, field in (
+            ('favorite', Favorites, 'favorites_count'),
+            ('shopping_cart', ShoppingCart, 'in_carts_count'),
+        ):
+            with self.subTest(url):
+                counters = self.get_counters(field)
+                self.assertEqual(self.change('post', url, [first]), {
+                    first: RECIPE_ADDED,
+                })
+                self.assertEqual(
+                    self.change(
+                        'post', url, [second, first, self.missing_id, second]
+                    ),
+                    {
+                        second: RECIPE_ADDED,
+                        first: RECIPE_UNCHANGED,
+                        self.missing_id: RECIPE_NOT_FOUND,
+                    },
+                )
+                self.assertEqual(
+                    set(model.objects.filter(user=self.user).values_list(
+                        'recipe_id', flat=True
+                    )),
+                    {first, second},
+                )
+                added = self.get_counters(field)
+                self.assertEqual(added[first], counters[first] + 1)
+                self.assertEqual(added[second], counters[second] + 1)
+                self.assertEqual(added[third], counters[third])
+                self.assert_shopping_list()
+
+                self.assertEqual(
+                    self.change(
+                        'delete', url, [first, third, self.missing_id]
+                    ),
+                    {
+                        first: RECIPE_REMOVED,
+                        third: RECIPE_UNCHANGED,
+                        self.missing_id: RECIPE_NOT_FOUND,
+                    },
+                )
+                removed = self.get_counters(field)
+                self.assertEqual(removed[first], counters[first])
+                self.assertEqual(removed[second], counters[second] + 1)
+                self.assertEqual(removed[third], counters[third])
+                self.assert_shopping_list()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TokenCacheTests(APITestCase):
+    """Пользователь из кэша токенов теряет доступ вместе с пользователем"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='Old-pass-1',
+            first_name='Повар', last_name='Поваров',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def assert_rejected(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_cached_fields(self):
+        fields = cache.get(get_token_cache_key(self.token.key))
+        self.assertEqual(fields['id'], self.user.id)
+        self.assertNotIn('password', fields)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/users/me/')
+        self.assertFalse([
+            query for query in context.captured_queries
+            if Token._meta.db_table in query['sql']
+        ])
+
+    def test_token_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assert_rejected()
+
+    def test_user_deactivated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assert_rejected()
+
+    def test_password_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'Old-pass-1',
+                'new_password': 'New-pass-2',
+            })
+        self.assertEqual(response.status_code, 204, response.content)
+        self.assert_rejected()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ConditionalGetTests(APITestCase):
+    """ETag меняется вместе с данными и флагами пользователя"""
+    @classmethod
+    def setUpTestData(cls):
+        create_sample_data(
+            users=3, recipes=8, ingredients=10, favorites_per_user=0,
+            cart_per_user=0, subscriptions_per_user=0,
+        )
+        cls.user, cls.other = User.objects.order_by('id')[:2]
+        cls.recipe = Recipe.objects.order_by('id').first()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def get_etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response['ETag']
+
+    def assert_etag_changes(self, change):
+        urls = ('/api/recipes/', f'/api/recipes/{self.recipe.id}/')
+        etags = [self.get_etag(url) for url in urls]
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.client.force_authenticate(self.user)
+        for url, etag in zip(urls, etags):
+            with self.subTest(url):
+                self.assertNotEqual(self.get_etag(url), etag)
+
+    def test_not_modified(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.id}/'):
+            with self.subTest(url):
+                etag = self.get_etag(url)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_recipe_edit(self):
+        def change():
+            self.client.force_authenticate(self.recipe.author)
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/',
+                {'cooking_time': self.recipe.cooking_time + 1},
+                format='json',
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+
+        self.assert_etag_changes(change)
+
+    def test_tag_edit(self):
+        def change():
+            tag = self.recipe.tags.first()
+            tag.name = 'Полдник'
+            tag.save()
+
+        self.assert_etag_changes(change)
+
+    def test_user_flags(self):
+        for url in ('favorite', 'shopping_cart'):
+            for method, status in (('post', 201), ('delete', 204)):
+                with self.subTest(url, method=method):
+                    def change():
+                        response = getattr(self.client, method)(
+                            f'/api/recipes/{self.recipe.id}/{url}/'
+                        )
+                        self.assertEqual(response.status_code, status)
+
+                    self.assert_etag_changes(change)
+
+    def test_users_do_not_share_etags(self):
+        for params in ({}, {'is_favorited': 1}, {'is_in_shopping_cart': 1}):
+            with self.subTest(params):
+                self.client.force_authenticate(self.user)
+                response = self.client.get('/api/recipes/', params)
+                etag = response['ETag']
+                self.client.force_authenticate(self.other)
+                response = self.client.get(
+                    '/api/recipes/', params, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FeedTests(APITestCase):
+    """Лента подписок: раскладка, backfill и чтение популярных авторов"""
+    @classmethod
+    def setUpTestData(cls):
+        create_sample_data(
+            users=3, recipes=20, ingredients=10, favorites_per_user=0,
+            cart_per_user=0, subscriptions_per_user=0,
+        )
+        cls.user = User.objects.order_by('id').first()
+        cls.author = User.objects.exclude(pk=cls.user.pk).filter(
+            recipes__isnull=False
+        ).first()
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def subscribe(self, author):
+        response = self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def get_feed(self):
+        response = self.client.get('/api/recipes/feed/', {'limit': 100})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def get_recipe_ids(self, author):
+        return list(Recipe.objects.filter(author=author).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+
+    def create_recipe(self, author):
+        return Recipe.objects.create(
+            author=author, name='Новый рецепт', text='Описание',
+            cooking_time=10, image='images/sample.png',
+        )
+
+    def test_subscribe_backfills(self):
+        self.assertEqual(self.get_feed(), [])
+        self.subscribe(self.author)
+        self.assertEqual(self.get_feed(), self.get_recipe_ids(self.author))
+
+    def test_unsubscribe_trims(self):
+        self.subscribe(self.author)
+        response = self.client.delete(
+            f'/api/users/{self.author.id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(self.get_feed(), [])
+
+    def test_fan_out_is_idempotent(self):
+        self.subscribe(self.author)
+        recipe = self.create_recipe(self.author)
+        FeedEntry.objects.fan_out(recipe)
+        FeedEntry.objects.backfill(self.user.id, self.author.id)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.user, recipe=recipe).count(), 1
+        )
+        self.assertEqual(self.get_feed(), self.get_recipe_ids(self.author))
+
+    def test_popular_author_read_at_request_time(self):
+        self.subscribe(self.author)
+        with mock.patch('recipes.models.FEED_FANOUT_MAX_FOLLOWERS', 0):
+            recipe = self.create_recipe(self.author)
+        recipe.refresh_from_db()
+        self.assertFalse(recipe.fanned_out)
+        self.assertFalse(FeedEntry.objects.filter(recipe=recipe).exists())
+        feed = self.get_feed()
+        self.assertEqual(feed[0], recipe.id)
+        self.assertEqual(feed, self.get_recipe_ids(self.author))
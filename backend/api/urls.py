@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from users.views import UserViewSet
 
+from . import async_views
+from .metrics import metrics_view
 from .views import IngredientsViewSet, RecipeViewSet, TagsViewSet
 
 app_name = 'api'
@@ -14,6 +17,31 @@ router_v1.register('tags', TagsViewSet, basename='tags')
 router_v1.register('recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
+    path('_metrics', metrics_view, name='metrics'),
+]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns += [
+        path('recipes/', async_views.recipe_list, name='recipes-list'),
+        path(
+            'recipes/<int:pk>/',
+            async_views.recipe_detail,
+            name='recipes-detail',
+        ),
+        path('tags/', async_views.tag_list, name='tags-list'),
+        path(
+            'ingredients/',
+            async_views.ingredient_list,
+            name='ingredients-list',
+        ),
+        path(
+            'users/subscriptions/',
+            async_views.subscriptions,
+            name='users-subscriptions',
+        ),
+    ]
+
+urlpatterns += [
     path('', include(router_v1.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
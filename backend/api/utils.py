@@ -1,37 +1,136 @@
-from api.serializers import MiniRecipeSerializer
+from api.conditional import touch_user_state
+from api.serializers import MiniRecipeSerializer, RecipeIdsSerializer
+from django.db import transaction
+from django.db.models import F
 from django.shortcuts import get_object_or_404
-from recipes.models import Recipe
+from recipes.constants import EXPORT_ITERATOR_CHUNK_SIZE
+from recipes.counters import RECIPE_COUNTER_FIELDS, change_counter
+from recipes.models import Recipe, ShoppingCart, ShoppingListItem
 from rest_framework import status
 from rest_framework.response import Response
 
+RECIPE_ADDED = 'added'
+RECIPE_REMOVED = 'removed'
+RECIPE_UNCHANGED = 'unchanged'
+RECIPE_NOT_FOUND = 'not_found'
+
+
+def change_user_recipes(user, model, recipe_ids, add):
+    """Добавляет рецепты в избранное или корзину либо убирает их.
+
+    Записи меняются одним запросом в обход сигналов, поэтому
+    счётчики рецептов, список покупок и версия флагов пользователя
+    обновляются здесь же. Возвращает id изменённых рецептов.
+    """
+    with transaction.atomic():
+        if add:
+            changed = model.objects.add_recipes(user.pk, recipe_ids)
+        else:
+            changed = model.objects.remove_recipes(user.pk, recipe_ids)
+        if not changed:
+            return changed
+        change_counter(
+            Recipe.objects.filter(pk__in=changed),
+            RECIPE_COUNTER_FIELDS[model], 1 if add else -1,
+        )
+        if model is ShoppingCart:
+            if add:
+                ShoppingListItem.objects.add_recipes(user.pk, changed)
+            else:
+                ShoppingListItem.objects.remove_recipes(user.pk, changed)
+        transaction.on_commit(lambda: touch_user_state(user.pk))
+    return changed
+
+
+def get_recipe_ids(pk):
+    """id рецепта из адреса списком, пустым для нечислового id"""
+    try:
+        return [int(pk)]
+    except ValueError:
+        return []
+
 
 def object_create(user, model, pk):
     """Общий метод для добавления рецепта в избранное и корзину"""
-    try:
-        recipe = Recipe.objects.get(id=pk)
-    except Recipe.DoesNotExist:
-        return Response(
-            'Такого рецепта не существует',
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    if model.objects.filter(user=user, recipe=recipe).exists():
+    recipe_ids = get_recipe_ids(pk)
+    if not change_user_recipes(user, model, recipe_ids, add=True):
+        if not Recipe.objects.filter(pk__in=recipe_ids).exists():
+            return Response(
+                'Такого рецепта не существует',
+                status=status.HTTP_400_BAD_REQUEST
+            )
         return Response(
             'Рецепт уже добавлен',
             status=status.HTTP_400_BAD_REQUEST
         )
-    model.objects.create(user=user, recipe=recipe)
-    serializer = MiniRecipeSerializer(recipe)
+    serializer = MiniRecipeSerializer(Recipe.objects.get(pk=pk))
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
 def object_delete(user, model, pk):
     """Общий метод для удаления рецепта из избранного и корзины"""
-    get_object_or_404(Recipe, id=pk)
-    obj = model.objects.filter(user=user, recipe__id=pk).first()
-    if obj is None:
+    recipe_ids = get_recipe_ids(pk)
+    if not change_user_recipes(user, model, recipe_ids, add=False):
+        get_object_or_404(Recipe, id__in=recipe_ids)
         return Response(
             'Рецепт удалён',
             status=status.HTTP_400_BAD_REQUEST
         )
-    obj.delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def objects_change(request, model):
+    """Общий метод для пачечного изменения избранного и корзины.
+
+    Для каждого id из запроса в ответе указано, что с ним стало:
+    added или removed, unchanged, если рецепт уже был добавлен
+    или удалён, и not_found, если рецепта нет.
+    """
+    serializer = RecipeIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    recipe_ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+    add = request.method == 'POST'
+    changed = set(change_user_recipes(request.user, model, recipe_ids, add))
+    rest = [recipe_id for recipe_id in recipe_ids if recipe_id not in changed]
+    existing = set(Recipe.objects.filter(
+        pk__in=rest
+    ).order_by().values_list('pk', flat=True)) if rest else set()
+
+    def outcome(recipe_id):
+        if recipe_id in changed:
+            return RECIPE_ADDED if add else RECIPE_REMOVED
+        if recipe_id in existing:
+            return RECIPE_UNCHANGED
+        return RECIPE_NOT_FOUND
+
+    return Response({
+        'recipes': [
+            {'id': recipe_id, 'status': outcome(recipe_id)}
+            for recipe_id in recipe_ids
+        ],
+    })
+
+
+SHOPPING_CART_ORDERING = {
+    'name': ('name',),
+    '-name': ('-name',),
+    'total': ('total', 'name'),
+    '-total': ('-total', 'name'),
+}
+
+
+def shopping_cart_rows(user, ordering='name', group_by_unit=False):
+    """Строки списка покупок, читаемые с сервера порциями"""
+    order_by = SHOPPING_CART_ORDERING.get(
+        ordering, SHOPPING_CART_ORDERING['name']
+    )
+    if group_by_unit:
+        order_by = ('measurement_unit',) + order_by
+    return ShoppingListItem.objects.filter(
+        user=user,
+        total__gt=0,
+    ).values(
+        'total',
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+    ).order_by(*order_by).iterator(chunk_size=EXPORT_ITERATOR_CHUNK_SIZE)
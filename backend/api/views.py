@@ -1,58 +1,142 @@
+from datetime import date
+
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from recipes.constants import SHOPPING_CART_FILENAME
-from recipes.models import (Favorites, IngredientAmount, Ingredients, Recipe,
-                            ShoppingCart, Tag)
+from recipes.constants import (INGREDIENT_SEARCH_LIMIT,
+                               INGREDIENT_SEARCH_MAX_LIMIT,
+                               SHOPPING_CART_FILENAME, SIMILAR_RECIPES_LIMIT)
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Favorites, Ingredients, Recipe, ShoppingCart, Tag
+from recipes.reference_cache import tags_cache
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
+from rest_framework.response import Response
 
-from .filters import IngredientFilter, RecipeFilter
-from .paginators import CustomPagination
+from .conditional import ConditionalGetMixin, recipes_etag, reference_etag
+from .filters import RecipeFilter
+from .paginators import CustomPagination, FeedPagination
 from .permissions import IsAuthorOrReadOnlyOrAuthenticated
+from .query_budget import QueryBudgetMixin
+from .renderers import (CSVShoppingCartRenderer, PDFShoppingCartRenderer,
+                        TextShoppingCartRenderer)
 from .serializers import (IngredientSerializer, RecipeCreateSerializer,
                           RecipeReadSerializer, TagSerializer)
-from .utils import object_create, object_delete
+from .utils import (object_create, object_delete, objects_change,
+                    shopping_cart_rows)
 
 User = get_user_model()
 
 
-class TagsViewSet(viewsets.ReadOnlyModelViewSet):
+def search_ingredients(query_params):
+    """Поиск ингредиентов по параметрам name, measurement_unit и limit"""
+    try:
+        limit = int(query_params.get('limit', INGREDIENT_SEARCH_LIMIT))
+    except ValueError:
+        limit = INGREDIENT_SEARCH_LIMIT
+    limit = min(max(limit, 1), INGREDIENT_SEARCH_MAX_LIMIT)
+    return ingredient_index.search(
+        query_params.get('name', ''),
+        limit,
+        measurement_unit=query_params.get('measurement_unit'),
+    )
+
+
+class ReferenceCacheMixin(ConditionalGetMixin):
+    """Чтение справочника из памяти процесса вместо запросов к БД.
+
+    ETag ответа строится по версии справочника.
+    """
+    reference_cache = None
+
+    def get_etag(self):
+        return reference_etag(
+            self.request, self.reference_cache, self.kwargs.get('pk')
+        )
+
+    def get_object(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            pk = int(self.kwargs[lookup_url_kwarg])
+        except ValueError:
+            pk = None
+        obj = self.reference_cache.get(pk)
+        if obj is None:
+            return super().get_object()
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class TagsViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для работы с тегами"""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    reference_cache = tags_cache
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.reference_cache.all(), many=True)
+        return Response(serializer.data)
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
-    """Вьюсет для работы с ингредиентами"""
+class IngredientsViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
+    """Вьюсет для работы с ингредиентами.
+
+    Поиск по началу названия идёт по индексу в памяти процесса,
+    по подстроке - в БД.
+    """
     queryset = Ingredients.objects.all()
     serializer_class = IngredientSerializer
-    filterset_class = IngredientFilter
-    filter_backends = (DjangoFilterBackend, SearchFilter)
-    search_fields = ('^name',)
     permission_classes = (AllowAny,)
     pagination_class = None
+    reference_cache = ingredient_index
+
+    def list(self, request, *args, **kwargs):
+        return Response(search_ingredients(request.query_params))
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, QueryBudgetMixin,
+                    viewsets.ModelViewSet):
     """Вьюсет для работы с рецептами """
     pagination_class = CustomPagination
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrReadOnlyOrAuthenticated,)
+    query_budget = {
+        'list': 7,
+        'retrieve': 6,
+        'feed': 7,
+        'similar': 6,
+        'partial_update': 31,
+    }
+    cursor_ordering = {
+        'list': ('-pub_date', '-id'),
+    }
+
+    def get_etag(self):
+        if self.action == 'list':
+            return recipes_etag(
+                self.request, self.filter_queryset(Recipe.objects.all())
+            )
+        if self.action == 'retrieve':
+            try:
+                queryset = Recipe.objects.filter(pk=self.kwargs['pk'])
+            except (TypeError, ValueError):
+                return None
+            return recipes_etag(self.request, queryset, self.kwargs['pk'])
+        return None
 
     def get_queryset(self):
         queryset = super().get_queryset()
         user = self.request.user
         if user.is_authenticated:
-            queryset = queryset.with_favorites_and_shopping_cart(user)
-        return queryset
+            return queryset.with_favorites_and_shopping_cart(user)
+        return queryset.with_related()
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -96,18 +180,83 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=['GET'],
         permission_classes=(IsAuthenticated,), detail=False
     )
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь"""
+        paginator = FeedPagination(self.paginator.get_page_size(request))
+        page = paginator.paginate_queryset(self.get_queryset(), request)
+        serializer = RecipeReadSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk):
+        """Рецепты с похожим набором ингредиентов"""
+        try:
+            limit = int(request.query_params.get(
+                'limit', SIMILAR_RECIPES_LIMIT
+            ))
+        except ValueError:
+            limit = SIMILAR_RECIPES_LIMIT
+        limit = min(max(limit, 1), SIMILAR_RECIPES_LIMIT)
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            raise NotFound()
+        recipes = list(self.get_queryset().similar_to(recipe_id)[:limit])
+        if not recipes and not Recipe.objects.filter(pk=recipe_id).exists():
+            raise NotFound()
+        serializer = RecipeReadSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(
+        methods=['POST', 'DELETE'], url_path='favorite',
+        permission_classes=(IsAuthenticated,), detail=False
+    )
+    def favorites(self, request):
+        return objects_change(request, Favorites)
+
+    @action(
+        methods=['POST', 'DELETE'], url_path='shopping_cart',
+        permission_classes=(IsAuthenticated,), detail=False
+    )
+    def shopping_carts(self, request):
+        return objects_change(request, ShoppingCart)
+
+    @action(
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,), detail=False,
+        renderer_classes=(
+            TextShoppingCartRenderer,
+            CSVShoppingCartRenderer,
+            PDFShoppingCartRenderer,
+        ),
+    )
     def download_shopping_cart(self, request):
-        ingredients = IngredientAmount.objects.filter(
-            recipe__shopping_cart__user=request.user).values(
-            'ingredient__name',
-            'ingredient__measurement_unit').annotate(total=Sum('amount'))
-
-        shopping_cart = '\n'.join([
-            f'{ingredient["ingredient__name"]} - {ingredient["total"]} '
-            f'{ingredient["ingredient__measurement_unit"]}'
-            for ingredient in ingredients
-        ])
-        filename = SHOPPING_CART_FILENAME
-        response = HttpResponse(shopping_cart, content_type='text/plain')
+        renderer = request.accepted_renderer
+        group_by_unit = (
+            request.query_params.get('group_by') == 'measurement_unit'
+        )
+        rows = shopping_cart_rows(
+            request.user,
+            ordering=request.query_params.get('ordering', 'name'),
+            group_by_unit=group_by_unit,
+        )
+        if isinstance(request._request, ASGIRequest):
+            # Django 3.2 читает потоковый ответ ASGI в цикле событий,
+            # где запросы к БД запрещены, поэтому строки читаются заранее
+            rows = list(rows)
+        response = StreamingHttpResponse(
+            renderer.stream(rows, group_by_unit=group_by_unit),
+            content_type=(
+                f'{renderer.media_type}; charset={renderer.charset}'
+                if renderer.charset else renderer.media_type
+            ),
+        )
+        filename = SHOPPING_CART_FILENAME.format(
+            date=date.today(), extension=renderer.format
+        )
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
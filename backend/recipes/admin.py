@@ -1,36 +1,130 @@
 from django.contrib import admin
 
+from .constants import ADMIN_LIST_PER_PAGE
+from .derived import (get_amounts, get_deltas, recipe_amounts_changed,
+                      recipe_ingredients_changed)
 from .models import (Favorites, IngredientAmount, Ingredients, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
+from .paginators import ApproximateCountPaginator
 
 
-class IngredientsAdmin(admin.ModelAdmin):
+class LargeTableAdmin(admin.ModelAdmin):
+    """Админка таблицы, которая может быть большой.
+
+    Число записей без фильтров оценивается, а общее число
+    при поиске не считается вторым запросом.
+    """
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+
+class IngredientsAdmin(LargeTableAdmin):
     list_display = ('name', 'measurement_unit',)
+    list_per_page = ADMIN_LIST_PER_PAGE
+    # В PostgreSQL поиск по префиксу идёт по индексу UPPER(name)
+    search_fields = ('^name',)
+    ordering = ('name',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'name' in form.changed_data:
+            Recipe.objects.filter(
+                amount_ingredients__ingredient=obj
+            ).update_computed_fields()
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Ingredients.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        """Удаление ингредиента меняет состав рецептов, где он был"""
+        recipe_ids = set(IngredientAmount.objects.filter(
+            ingredient__in=queryset
+        ).values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        # Позиции списков покупок с ингредиентом удалены каскадом
+        recipe_ingredients_changed(recipe_ids, {})
+
 
+class RecipeAdmin(LargeTableAdmin):
+    list_display = (
+        'name', 'author', 'favorites_count', 'in_carts_count', 'id',
+    )
+    search_fields = ('name',)
+    autocomplete_fields = ('author',)
 
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'id',)
+    def get_queryset(self, request):
+        # Автор нужен и в списке, и в подписи рецепта в автодополнении
+        return super().get_queryset(request).select_related('author')
+
+    def get_search_results(self, request, queryset, search_term):
+        """Полнотекстовый поиск по индексу рецептов"""
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        Recipe.objects.filter(pk=obj.pk).update_computed_fields()
 
 
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'slug',)
 
 
-class FavoritesAdmin(admin.ModelAdmin):
+class FavoritesAdmin(LargeTableAdmin):
     list_display = ('user', 'recipe',)
+    list_select_related = ('user', 'recipe__author')
+    autocomplete_fields = ('user', 'recipe')
 
 
-class IngredientAmountAdmin(admin.ModelAdmin):
+class IngredientAmountAdmin(LargeTableAdmin):
     list_display = ('recipe', 'amount', 'ingredient',)
+    list_select_related = ('recipe__author', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change and 'recipe' in form.changed_data:
+            # Строка перенесена в другой рецепт: меняются оба
+            recipe_ids.add(form.initial['recipe'])
+        old_amounts = get_amounts(recipe_ids)
+        super().save_model(request, obj, form, change)
+        deltas = get_deltas(old_amounts, get_amounts(recipe_ids))
+        if change and form.changed_data == ['amount']:
+            recipe_amounts_changed(recipe_ids, deltas)
+        else:
+            recipe_ingredients_changed(recipe_ids, deltas)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(
+            request, IngredientAmount.objects.filter(pk=obj.pk)
+        )
 
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        old_amounts = get_amounts(recipe_ids)
+        super().delete_queryset(request, queryset)
+        recipe_ingredients_changed(
+            recipe_ids, get_deltas(old_amounts, get_amounts(recipe_ids))
+        )
 
-class ShoppingCartAdmin(admin.ModelAdmin):
+
+class ShoppingCartAdmin(LargeTableAdmin):
     list_display = ('user', 'recipe',)
+    list_select_related = ('user', 'recipe__author')
+    autocomplete_fields = ('user', 'recipe')
+
+
+class ShoppingListItemAdmin(LargeTableAdmin):
+    list_display = ('user', 'ingredient', 'total',)
+    list_select_related = ('user', 'ingredient')
+    autocomplete_fields = ('user', 'ingredient')
 
 
 admin.site.register(IngredientAmount, IngredientAmountAdmin)
 admin.site.register(Ingredients, IngredientsAdmin)
 admin.site.register(Favorites, FavoritesAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
+admin.site.register(ShoppingListItem, ShoppingListItemAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Recipe, RecipeAdmin)
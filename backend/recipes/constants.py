@@ -1,9 +1,44 @@
-from datetime import date
-
 MAX_LENGTH_200 = 200
 MAX_COLOR_LENGTH = 7
 MAX_CHAR_LENGTH_254 = 254
 MAX_CHAR_LENGTH_150 = 150
 PAGE_LIMIT_SIZE = 6
 MEASUREMENT_UNITS_LENGTH = 10
-SHOPPING_CART_FILENAME = f'shopping_cart_{date.today()}.txt'
+SHOPPING_CART_FILENAME = 'shopping_cart_{date}.{extension}'
+EXPORT_ITERATOR_CHUNK_SIZE = 2000
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_MAX_LIMIT = 100
+INGREDIENT_SUBSTRING_MIN_LENGTH = 3
+BULK_RECIPES_MAX_LENGTH = 100
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_LIMIT = 100
+SIMILAR_PERMUTATIONS = 64
+SIMILAR_BANDS = 16
+SIMILAR_RECIPES_LIMIT = 10
+SIMILAR_MAX_BUCKET_SIZE = 500
+SIMILAR_BATCH_SIZE = 1000
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'card': (640, 640),
+}
+IMAGE_HASH_LENGTH = 64
+CURSOR_FILTER_HASH_LENGTH = 16
+SEARCH_CONFIG = 'russian'
+SEARCH_NAME_WEIGHT = 10.0
+COMPUTED_FIELDS_BATCH_SIZE = 1000
+COUNTERS_BATCH_SIZE = 1000
+ADMIN_APPROXIMATE_COUNT_MIN = 10000
+ADMIN_LIST_PER_PAGE = 50
+TAGS_MODE_ANY = 'any'
+TAGS_MODE_ALL = 'all'
+TAGS_MODE_CHOICES = (
+    (TAGS_MODE_ANY, 'Любой из тегов'),
+    (TAGS_MODE_ALL, 'Все теги'),
+)
+METRICS_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+METRICS_QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+# Объём данных для проверки планов запросов
+PLAN_CHECK_RECIPES = 5000
+PLAN_CHECK_USERS = 500
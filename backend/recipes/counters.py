@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorites, Recipe, ShoppingCart
+from users.models import User
+
+RECIPE_COUNTER_FIELDS = {
+    Favorites: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+# Поле счётчика: модель связей и её внешний ключ на считаемый объект
+RECIPE_COUNTERS = {
+    'favorites_count': (Favorites, 'recipe'),
+    'in_carts_count': (ShoppingCart, 'recipe'),
+}
+AUTHOR_COUNTERS = {
+    'recipes_count': (Recipe, 'author'),
+}
+COUNTERS = (
+    (Recipe, RECIPE_COUNTERS),
+    (User, AUTHOR_COUNTERS),
+)
+
+
+def actual_count(model, field):
+    """Подзапрос с настоящим числом связей объекта"""
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def change_counter(queryset, field, delta):
+    """Атомарно меняет счётчик, не опуская его ниже нуля"""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def reconcile_counters(queryset, counters, dry_run=False):
+    """Находит объекты с неверными счётчиками и пересчитывает их.
+
+    Пересчёт выполняется одним UPDATE с подзапросами, поэтому
+    параллельные изменения не теряются. Возвращает число
+    исправленных объектов.
+    """
+    actual = {
+        field: actual_count(model, fk)
+        for field, (model, fk) in counters.items()
+    }
+    drift = Q()
+    for field in counters:
+        drift |= ~Q(**{field: F(f'actual_{field}')})
+    drifted = list(queryset.annotate(**{
+        f'actual_{field}': expression for field, expression in actual.items()
+    }).filter(drift).values_list('pk', flat=True))
+    if drifted and not dry_run:
+        with transaction.atomic():
+            queryset.model.objects.filter(pk__in=drifted).update(**actual)
+    return len(drifted)
+
+
+def iterate_batches(model, batch_size):
+    """Выборки объектов модели по диапазонам первичного ключа"""
+    last_pk = 0
+    while True:
+        pks = list(model.objects.filter(pk__gt=last_pk).order_by(
+            'pk'
+        ).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        yield model.objects.filter(pk__gte=pks[0], pk__lte=pks[-1])
+        last_pk = pks[-1]
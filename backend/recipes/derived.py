@@ -0,0 +1,49 @@
+from recipes.models import IngredientAmount, Recipe, ShoppingListItem
+from recipes.similarity import update_similar_recipes
+
+
+def get_amounts(recipe_ids):
+    """Количества ингредиентов рецептов: {(рецепт, ингредиент): количество}"""
+    amounts = IngredientAmount.objects.filter(
+        recipe__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient_id', 'amount')
+    return {
+        (recipe_id, ingredient_id): amount
+        for recipe_id, ingredient_id, amount in amounts
+    }
+
+
+def get_deltas(old_amounts, new_amounts):
+    """Изменения количеств между двумя результатами get_amounts()"""
+    return {
+        key: new_amounts.get(key, 0) - old_amounts.get(key, 0)
+        for key in old_amounts.keys() | new_amounts.keys()
+    }
+
+
+def recipe_amounts_changed(recipe_ids, deltas):
+    """Обновляет производные данные, когда поменялись только количества.
+
+    Набор ингредиентов прежний, поэтому поисковый текст и похожие
+    рецепты не пересчитываются: меняются время изменения рецептов
+    и списки покупок.
+    """
+    Recipe.objects.filter(pk__in=recipe_ids).touch()
+    ShoppingListItem.objects.apply_deltas(deltas)
+
+
+def recipe_ingredients_changed(recipe_ids, deltas):
+    """Обновляет всё, что вычисляется из ингредиентов рецептов.
+
+    Вызывается после любого изменения IngredientAmount - из API,
+    из админки или команд: поисковый текст и набор ингредиентов,
+    время изменения рецепта, списки покупок всех, у кого рецепт
+    в корзине, и индекс похожих рецептов. deltas - изменения
+    количеств в формате get_deltas(), по ним списки покупок
+    правятся без пересчёта.
+    """
+    recipe_ids = list(recipe_ids)
+    recipes = Recipe.objects.filter(pk__in=recipe_ids)
+    recipes.update_computed_fields()
+    ShoppingListItem.objects.apply_deltas(deltas)
+    update_similar_recipes(recipe_ids)
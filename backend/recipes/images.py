@@ -0,0 +1,74 @@
+import os
+from hashlib import sha256
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+from recipes.constants import RECIPE_IMAGE_VARIANTS
+
+IMAGES_DIR = 'images'
+VARIANTS_DIR = 'images/variants'
+VARIANT_FORMAT, VARIANT_EXTENSION = (
+    ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+)
+
+
+def store_original(content, extension):
+    """Сохраняет оригинал под именем по хэшу содержимого.
+
+    Одинаковые загрузки попадают в один и тот же файл.
+    """
+    digest = sha256(content).hexdigest()
+    name = f'{IMAGES_DIR}/{digest}{extension}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return digest, name
+
+
+def make_variants(digest, content):
+    """Уменьшенные копии изображения, по одной на размер из настроек"""
+    names = {}
+    image = None
+    for variant, size in RECIPE_IMAGE_VARIANTS.items():
+        name = f'{VARIANTS_DIR}/{digest}_{variant}.{VARIANT_EXTENSION}'
+        if not default_storage.exists(name):
+            if image is None:
+                image = ImageOps.exif_transpose(Image.open(BytesIO(content)))
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA')
+                if VARIANT_FORMAT == 'JPEG':
+                    image = image.convert('RGB')
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            output = BytesIO()
+            resized.save(output, VARIANT_FORMAT, quality=80, method=4)
+            name = default_storage.save(name, ContentFile(output.getvalue()))
+        names[variant] = name
+    return names
+
+
+def process_image_content(content, extension):
+    """Поля рецепта для загруженного изображения"""
+    digest, name = store_original(content, extension)
+    variants = make_variants(digest, content)
+    return {
+        'image': name,
+        'image_hash': digest,
+        'image_thumbnail': variants['thumbnail'],
+        'image_card': variants['card'],
+    }
+
+
+def process_upload(upload):
+    """Поля рецепта для файла, пришедшего в запросе"""
+    upload.seek(0)
+    extension = os.path.splitext(upload.name)[1].lower()
+    return process_image_content(upload.read(), extension)
+
+
+def process_stored_image(name):
+    """Поля рецепта для файла, уже лежащего в хранилище"""
+    with default_storage.open(name, 'rb') as image_file:
+        content = image_file.read()
+    return process_image_content(content, os.path.splitext(name)[1].lower())
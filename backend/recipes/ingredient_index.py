@@ -0,0 +1,101 @@
+from bisect import bisect_left
+
+from recipes.constants import INGREDIENT_SUBSTRING_MIN_LENGTH
+from recipes.models import Ingredients
+from recipes.reference_cache import ReferenceCache
+
+
+def get_trigrams(text):
+    return {text[index:index + 3] for index in range(len(text) - 2)}
+
+
+class IngredientIndex(ReferenceCache):
+    """Справочник ингредиентов с индексом названий в памяти процесса.
+
+    Ингредиенты хранятся кортежами (id, название, единица измерения)
+    в списке, отсортированном по названию, поэтому поиск по префиксу
+    выполняется двоичным поиском без обращения к БД. Для поиска по
+    подстроке строится словарь триграмм: триграмма -> номера строк,
+    в названии которых она встречается.
+    """
+    def load(self):
+        return list(self.model.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ))
+
+    def build(self, rows):
+        rows.sort(key=lambda row: (row[1].lower(), row[0]))
+        keys = [row[1].lower() for row in rows]
+        trigrams = {}
+        for index, key in enumerate(keys):
+            for trigram in get_trigrams(key):
+                trigrams.setdefault(trigram, []).append(index)
+        return {
+            'entries': rows,
+            'keys': keys,
+            'pk': {row[0]: row for row in rows},
+            'trigrams': trigrams,
+        }
+
+    def get(self, pk):
+        row = self.get_data()['pk'].get(pk)
+        if row is None:
+            return None
+        pk, name, measurement_unit = row
+        return self.model(
+            pk=pk, name=name, measurement_unit=measurement_unit
+        )
+
+    def search_substring(self, data, query, limit, measurement_unit=None):
+        """Ингредиенты, в названии которых запрос есть не в начале.
+
+        Проверяются только строки с самой редкой триграммой запроса,
+        номера строк в словаре идут в порядке названий.
+        """
+        entries, keys = data['entries'], data['keys']
+        postings = [
+            data['trigrams'].get(trigram, ())
+            for trigram in get_trigrams(query)
+        ]
+        results = []
+        for index in min(postings, key=len):
+            if len(results) >= limit:
+                break
+            key = keys[index]
+            if query not in key or key.startswith(query):
+                continue
+            row = entries[index]
+            if measurement_unit is None or row[2] == measurement_unit:
+                results.append(row)
+        return results
+
+    def search(self, query, limit, measurement_unit=None):
+        """Ингредиенты по запросу: точное совпадение, префикс, подстрока.
+
+        Подстрока ищется, только если префикс дал меньше limit
+        результатов и запрос не короче INGREDIENT_SUBSTRING_MIN_LENGTH:
+        в более коротком запросе нет ни одной триграммы.
+        """
+        data = self.get_data()
+        entries, keys = data['entries'], data['keys']
+        query = query.strip().lower()
+        results = []
+        start = bisect_left(keys, query)
+        for index in range(start, len(entries)):
+            if len(results) >= limit or not keys[index].startswith(query):
+                break
+            row = entries[index]
+            if measurement_unit is None or row[2] == measurement_unit:
+                results.append(row)
+        if (len(results) < limit
+                and len(query) >= INGREDIENT_SUBSTRING_MIN_LENGTH):
+            results.extend(self.search_substring(
+                data, query, limit - len(results), measurement_unit
+            ))
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for pk, name, measurement_unit in results
+        ]
+
+
+ingredient_index = IngredientIndex(Ingredients)
@@ -0,0 +1,72 @@
+import json
+
+from django.db import connection, models
+from django.db.models import BooleanField, IntegerField
+from django.db.models.expressions import RawSQL
+
+
+class IngredientSetField(models.Field):
+    """Отсортированный список id ингредиентов рецепта.
+
+    В PostgreSQL хранится массивом integer[] с индексом GIN,
+    в остальных СУБД строкой JSON.
+    """
+    description = 'Набор id ингредиентов'
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'integer[]'
+        return 'text'
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, list):
+            return value
+        return json.loads(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        value = sorted(set(value))
+        if connection.vendor == 'postgresql':
+            return value
+        return json.dumps(value)
+
+
+def ingredient_set_expressions(table, ingredient_ids, missing):
+    """Предварительное условие и число совпавших ингредиентов рецепта.
+
+    В PostgreSQL условие использует индекс GIN по массиву:
+    без недостающих ингредиентов это вложение массива,
+    иначе пересечение с набором пользователя.
+    Рецепты без единого совпавшего ингредиента не подходят.
+    """
+    if connection.vendor == 'postgresql':
+        matched = RawSQL(
+            f'(SELECT count(*) FROM unnest({table}.ingredient_ids) AS item '
+            f'WHERE item = ANY(%s::integer[]))',
+            (ingredient_ids,),
+            output_field=IntegerField(),
+        )
+        if missing:
+            condition = RawSQL(
+                f'{table}.ingredient_ids && %s::integer[]',
+                (ingredient_ids,),
+                output_field=BooleanField(),
+            )
+        else:
+            condition = RawSQL(
+                f'{table}.ingredient_ids <@ %s::integer[]',
+                (ingredient_ids,),
+                output_field=BooleanField(),
+            )
+        return condition, matched
+    matched = RawSQL(
+        f'(SELECT count(*) FROM json_each({table}.ingredient_ids) '
+        f'WHERE value IN (SELECT value FROM json_each(%s)))',
+        (json.dumps(ingredient_ids),),
+        output_field=IntegerField(),
+    )
+    return None, matched
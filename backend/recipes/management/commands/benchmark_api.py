@@ -0,0 +1,323 @@
+import base64
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from io import BytesIO
+
+import django
+from api.query_budget import QueryCounter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from PIL import Image
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Favorites, Ingredients, Recipe, ShoppingCart, Tag
+from recipes.reference_cache import tags_cache
+from recipes.sample_data import create_sample_data
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+
+def make_image():
+    buffer = BytesIO()
+    Image.new('RGB', (800, 600), 'orange').save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class Scenarios:
+    """Запросы, которые замеряются на каждом наборе данных.
+
+    Каждый сценарий возвращает функцию, выполняющую один запрос.
+    """
+    def __init__(self):
+        self.recipe = Recipe.objects.select_related('author').order_by(
+            '-pub_date', '-id'
+        )[Recipe.objects.count() // 2]
+        # Автор рецепта может его изменять
+        self.user = self.recipe.author
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.tags = list(Tag.objects.values_list('slug', flat=True))
+        self.tag_ids = list(Tag.objects.values_list('id', flat=True))
+        self.ingredient_ids = list(
+            Ingredients.objects.values_list('id', flat=True)[:10]
+        )
+        self.image = make_image()
+        self.counter = 0
+
+    def recipe_data(self, with_image):
+        self.counter += 1
+        shift = self.counter % 5
+        data = {
+            'name': f'Рецепт для замера {self.counter}',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': self.tag_ids[:2],
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 10 + shift}
+                for ingredient_id in self.ingredient_ids[shift:shift + 5]
+            ],
+        }
+        if with_image:
+            data['image'] = self.image
+        return data
+
+    def get(self, url, params=None):
+        return lambda: self.client.get(url, params)
+
+    def toggle(self, url, model):
+        """Попеременно добавляет рецепт и удаляет его"""
+        model.objects.filter(user=self.user, recipe=self.recipe).delete()
+        state = {'added': False}
+
+        def request():
+            method = self.client.delete if state['added'] else self.client.post
+            state['added'] = not state['added']
+            return method(url)
+        return request
+
+    def all(self):
+        recipe_url = f'/api/recipes/{self.recipe.id}/'
+        return {
+            'recipes-list': self.get('/api/recipes/'),
+            'recipes-list-filtered': self.get('/api/recipes/', {
+                'tags': self.tags[:2], 'is_favorited': 1,
+            }),
+            'recipes-list-cursor': self.get('/api/recipes/', {'cursor': ''}),
+            'recipes-search': self.get('/api/recipes/', {
+                'search': 'рецепт',
+            }),
+            'recipes-cookable': self.get('/api/recipes/', {
+                'ingredients': ','.join(map(str, self.ingredient_ids)),
+                'missing': 2,
+            }),
+            'recipes-detail': self.get(recipe_url),
+            'recipes-feed': self.get('/api/recipes/feed/'),
+            'recipes-similar': self.get(f'{recipe_url}similar/'),
+            'recipes-create': lambda: self.client.post(
+                '/api/recipes/', self.recipe_data(with_image=True),
+                format='json',
+            ),
+            'recipes-update': lambda: self.client.patch(
+                recipe_url, self.recipe_data(with_image=False),
+                format='json',
+            ),
+            'favorite-toggle': self.toggle(
+                f'{recipe_url}favorite/', Favorites
+            ),
+            'shopping-cart-toggle': self.toggle(
+                f'{recipe_url}shopping_cart/', ShoppingCart
+            ),
+            'download-shopping-cart': self.get(
+                '/api/recipes/download_shopping_cart/'
+            ),
+            'subscriptions': self.get('/api/users/subscriptions/', {
+                'recipes_limit': 3,
+            }),
+            'ingredients-search': self.get('/api/ingredients/', {
+                'name': 'ингредиент 1',
+            }),
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        ' Замерить задержку, пропускную способность и число запросов '
+        'основных эндпоинтов API на временной тестовой базе '
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='100,1000,10000',
+            help='Число рецептов в наборах данных через запятую',
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=30,
+            help='Сколько раз выполнить каждый запрос',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Сколько запросов выполнить до замеров',
+        )
+        parser.add_argument(
+            '--scenarios', default='',
+            help='Только указанные сценарии через запятую',
+        )
+        parser.add_argument(
+            '--output', default=None,
+            help='Файл для результатов в формате JSON',
+        )
+        parser.add_argument(
+            '--compare', default=None,
+            help='Файл с прошлыми результатами для сравнения',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes: ожидались числа через запятую')
+        selected = {
+            name for name in options['scenarios'].split(',') if name
+        }
+        self.stdout.write(self.style.WARNING('Старт команды'))
+        commit = get_git_commit()
+        report = {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'git_commit': commit,
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+            },
+            'results': [],
+        }
+        workdir = tempfile.mkdtemp(prefix='foodgram-benchmark-')
+        setup_test_environment()
+        try:
+            with override_settings(
+                MEDIA_ROOT=workdir,
+                METRICS_DIR=workdir,
+                CACHES=BENCHMARK_CACHES,
+            ):
+                for size in sizes:
+                    report['results'].extend(
+                        self.run_size(size, selected, options)
+                    )
+        finally:
+            teardown_test_environment()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        output = options['output'] or (
+            f'benchmark-{commit or "local"}-'
+            f'{datetime.now():%Y%m%d-%H%M%S}.json'
+        )
+        with open(output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], report['results'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Результаты сохранены: {output}')
+        )
+
+    def run_size(self, size, selected, options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            started = time.monotonic()
+            create_sample_data(users=max(size // 20, 20), recipes=size)
+            tags_cache.invalidate()
+            ingredient_index.invalidate()
+            self.stdout.write(
+                f'Набор из {size} рецептов создан за '
+                f'{time.monotonic() - started:.1f} с'
+            )
+            scenarios = Scenarios().all()
+            results = []
+            for name, request in scenarios.items():
+                if selected and name not in selected:
+                    continue
+                result = self.measure(request, options)
+                result.update(size=size, scenario=name)
+                results.append(result)
+                self.stdout.write(
+                    f'  {name}: p50 {result["latency_ms"]["p50"]} мс, '
+                    f'p95 {result["latency_ms"]["p95"]} мс, '
+                    f'{result["throughput_rps"]} запр/с, '
+                    f'запросов к БД {result["queries"]["max"]}'
+                )
+            return results
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def measure(self, request, options):
+        for _ in range(options['warmup']):
+            self.consume(request())
+        latencies, queries, statuses = [], [], set()
+        started = time.perf_counter()
+        for _ in range(options['iterations']):
+            counter = QueryCounter()
+            request_started = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                response = request()
+                self.consume(response)
+            latencies.append((time.perf_counter() - request_started) * 1000)
+            queries.append(counter.count)
+            statuses.add(response.status_code)
+        elapsed = time.perf_counter() - started
+        return {
+            'latency_ms': {
+                'mean': round(statistics.mean(latencies), 2),
+                'p50': round(percentile(latencies, 0.5), 2),
+                'p95': round(percentile(latencies, 0.95), 2),
+                'p99': round(percentile(latencies, 0.99), 2),
+                'min': round(min(latencies), 2),
+                'max': round(max(latencies), 2),
+            },
+            'throughput_rps': round(len(latencies) / elapsed, 1),
+            'queries': {
+                'mean': round(statistics.mean(queries), 2),
+                'max': max(queries),
+            },
+            'statuses': sorted(statuses),
+        }
+
+    def consume(self, response):
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as baseline_file:
+            baseline = {
+                (row['size'], row['scenario']): row
+                for row in json.load(baseline_file)['results']
+            }
+        self.stdout.write('Сравнение p50 и числа запросов с ' + path)
+        for row in results:
+            old = baseline.get((row['size'], row['scenario']))
+            if old is None:
+                continue
+            before = old['latency_ms']['p50']
+            after = row['latency_ms']['p50']
+            change = (after - before) / before * 100 if before else 0.0
+            self.stdout.write(
+                f'  {row["size"]:>7} {row["scenario"]:<24} '
+                f'{before:>8} -> {after:>8} мс ({change:+.0f}%), '
+                f'запросов {old["queries"]["max"]} -> '
+                f'{row["queries"]["max"]}'
+            )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from recipes.constants import SIMILAR_BATCH_SIZE
+from recipes.models import SimilarRecipe
+from recipes.similarity import rebuild_similar_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        ' Построить заново индекс LSH по наборам ингредиентов '
+        'и списки похожих рецептов '
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=SIMILAR_BATCH_SIZE,
+            help='Сколько рецептов обрабатывать за один проход',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Старт команды'))
+        recipes, buckets = rebuild_similar_recipes(options['batch_size'])
+        self.stdout.write(
+            f'Рецептов: {recipes}, '
+            f'корзин LSH: {buckets}, '
+            f'пар похожих рецептов: {SimilarRecipe.objects.count()}'
+        )
+        self.stdout.write(self.style.SUCCESS('Индекс похожих рецептов готов'))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from recipes.constants import PLAN_CHECK_RECIPES, PLAN_CHECK_USERS
+from recipes.query_plans import SEQ_SCAN_PATTERNS, check_plans
+from recipes.sample_data import create_sample_data
+
+
+class Command(BaseCommand):
+    help = (
+        ' Проверить по EXPLAIN, что горячие запросы используют индексы. '
+        'Данные создаются во временной тестовой базе '
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=PLAN_CHECK_RECIPES,
+            help='Сколько рецептов создать',
+        )
+        parser.add_argument(
+            '--users', type=int, default=PLAN_CHECK_USERS,
+            help='Сколько пользователей создать',
+        )
+        parser.add_argument(
+            '--show-plans', action='store_true',
+            help='Вывести планы всех запросов',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SEQ_SCAN_PATTERNS:
+            raise CommandError(
+                f'Проверка не поддерживает СУБД {connection.vendor}'
+            )
+        self.stdout.write(self.style.WARNING('Старт команды'))
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            create_sample_data(
+                users=options['users'], recipes=options['recipes']
+            )
+            failures = 0
+            for name, errors, plan in check_plans():
+                if errors:
+                    failures += 1
+                    self.stdout.write(
+                        self.style.ERROR(f'{name}: {"; ".join(errors)}')
+                    )
+                else:
+                    self.stdout.write(f'{name}: OK')
+                if errors or options['show_plans']:
+                    self.stdout.write(plan)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        if failures:
+            raise CommandError(
+                f'Запросов с неудачным планом: {failures}'
+            )
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке'))
@@ -1,26 +1,187 @@
+import csv
 import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.ingredient_index import ingredient_index
 from recipes.models import Ingredients, Tag
+from recipes.reference_cache import tags_cache
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(data_file):
+    """Читает JSON-массив объектов по одному, не загружая файл целиком"""
+    decoder = json.JSONDecoder()
+    buffer = data_file.read(READ_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив')
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = data_file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный JSON в файле')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def iter_ingredients(path):
+    """Пары (название, единица измерения) из JSON или CSV файла"""
+    with open(path, encoding='utf-8') as data_file:
+        if path.suffix == '.csv':
+            for row in csv.reader(data_file):
+                if len(row) >= 2:
+                    yield row[0].strip(), row[1].strip()
+        else:
+            for item in iter_json_array(data_file):
+                yield item['name'].strip(), item['measurement_unit'].strip()
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class CSVRowsFile:
+    """Файлоподобный объект, отдающий строки CSV для COPY FROM STDIN"""
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._writer = csv.writer(self)
+        self._buffer = ''
+
+    def write(self, value):
+        self._buffer += value
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    readline = read
 
 
 class Command(BaseCommand):
     help = ' Загрузить данные в модель ингредиентов '
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients', default='data/ingredients.json',
+            help='Файл ингредиентов в формате JSON или CSV',
+        )
+        parser.add_argument(
+            '--tags', default='data/tags.json',
+            help='Файл тегов в формате JSON',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько строк вставлять за один запрос',
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Загрузить ингредиенты через COPY (только PostgreSQL)',
+        )
+        parser.add_argument(
+            '--skip-tags', action='store_true',
+            help='Не загружать теги',
+        )
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.WARNING('Старт команды'))
-        with open('data/ingredients.json', encoding='utf-8',
-                  ) as data_file_ingredients:
-            ingredient_data = json.loads(data_file_ingredients.read())
-            for ingredient in ingredient_data:
-                if not Ingredients.objects.filter(
-                        name=ingredient['name']).exists():
-                    Ingredients.objects.create(**ingredient)
-
-        with open('data/tags.json', encoding='utf-8',
-                  ) as data_file_tags:
-            tags_data = json.loads(data_file_tags.read())
-            for tags in tags_data:
-                Tag.objects.create(**tags)
+        path = Path(options['ingredients'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+        count_before = Ingredients.objects.count()
+        started = time.monotonic()
+        if options['copy']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('COPY доступен только для PostgreSQL')
+            processed = self.copy_ingredients(path)
+        else:
+            processed = self.insert_ingredients(path, options['batch_size'])
+        elapsed = time.monotonic() - started
+        created = Ingredients.objects.count() - count_before
+        self.stdout.write(
+            f'Ингредиентов обработано: {processed}, добавлено: {created}, '
+            f'{self.rate(processed, elapsed)} строк/с'
+        )
+        ingredient_index.invalidate()
+
+        if not options['skip_tags']:
+            with open(options['tags'], encoding='utf-8') as data_file_tags:
+                tags = [Tag(**tag) for tag in json.load(data_file_tags)]
+            Tag.objects.bulk_create(tags, ignore_conflicts=True)
+            tags_cache.invalidate()
+            self.stdout.write(f'Тегов обработано: {len(tags)}')
 
         self.stdout.write(self.style.SUCCESS('Данные загружены'))
+
+    def rate(self, rows, elapsed):
+        return round(rows / elapsed) if elapsed else rows
+
+    def insert_ingredients(self, path, batch_size):
+        processed = 0
+        started = time.monotonic()
+        for batch in batches(iter_ingredients(path), batch_size):
+            Ingredients.objects.bulk_create(
+                [
+                    Ingredients(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in batch
+                ],
+                ignore_conflicts=True,
+            )
+            processed += len(batch)
+            self.stdout.write(
+                f'  {processed} строк, '
+                f'{self.rate(processed, time.monotonic() - started)} строк/с'
+            )
+        return processed
+
+    def copy_ingredients(self, path):
+        processed = 0
+
+        def counted(rows):
+            nonlocal processed
+            for row in rows:
+                processed += 1
+                yield row
+
+        table = connection.ops.quote_name(Ingredients._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE import_ingredients '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY import_ingredients (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                CSVRowsFile(counted(iter_ingredients(path))),
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT DISTINCT name, measurement_unit '
+                f'FROM import_ingredients '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+        return processed
@@ -0,0 +1,99 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from recipes.images import process_stored_image
+from recipes.models import Recipe
+
+
+def process_image(name):
+    try:
+        return name, process_stored_image(name), None
+    except Exception as error:
+        return name, None, str(error)
+
+
+class Command(BaseCommand):
+    help = ' Сгенерировать уменьшенные копии изображений рецептов '
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Число процессов (по умолчанию по числу ядер)',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Обработать и уже обработанные рецепты',
+        )
+        parser.add_argument(
+            '--delete-originals', action='store_true',
+            help='Удалить старые файлы, на которые больше не ссылаются',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Старт команды'))
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_hash='')
+        variants = defaultdict(set)
+        for name, thumbnail, card in recipes.values_list(
+            'image', 'image_thumbnail', 'image_card'
+        ):
+            variants[name].update({thumbnail, card} - {''})
+        names = sorted(variants)
+        connections.close_all()
+        processed = failed = 0
+        replaced = set()
+        replaced_variants = set()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [pool.submit(process_image, name) for name in names]
+            for future in as_completed(futures):
+                name, fields, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                    continue
+                # Новое время изменения сбрасывает ETag списков рецептов
+                recipes.filter(image=name).update(
+                    **fields, updated_at=timezone.now()
+                )
+                if fields['image'] != name:
+                    replaced.add(name)
+                replaced_variants.update(variants[name] - {
+                    fields['image_thumbnail'], fields['image_card'],
+                })
+                processed += 1
+                if processed % 100 == 0:
+                    self.stdout.write(f'  обработано {processed}')
+
+        self.delete_unused_variants(replaced_variants)
+        if options['delete_originals']:
+            still_used = set(Recipe.objects.filter(
+                image__in=replaced
+            ).values_list('image', flat=True))
+            for name in replaced - still_used:
+                default_storage.delete(name)
+            self.stdout.write(
+                f'Удалено старых файлов: {len(replaced - still_used)}'
+            )
+        self.stdout.write(
+            f'Изображений обработано: {processed}, с ошибками: {failed}'
+        )
+        self.stdout.write(self.style.SUCCESS('Изображения обработаны'))
+
+    def delete_unused_variants(self, names):
+        """Удаляет уменьшенные копии, которые заменила обработка"""
+        if not names:
+            return
+        used = Recipe.objects.filter(
+            Q(image_thumbnail__in=names) | Q(image_card__in=names)
+        ).values_list('image_thumbnail', 'image_card')
+        unused = names - {name for row in used for name in row}
+        for name in unused:
+            default_storage.delete(name)
+        if unused:
+            self.stdout.write(f'Удалено старых копий: {len(unused)}')
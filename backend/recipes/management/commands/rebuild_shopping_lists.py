@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from recipes.models import ShoppingListItem
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ' Сверить списки покупок с корзинами и исправить расхождения '
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько пользователей сверять за один проход',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Старт команды'))
+        batch_size = options['batch_size']
+        user_ids = list(User.objects.filter(
+            Q(shopping_cart__isnull=False) | Q(shopping_list__isnull=False)
+        ).distinct().order_by('pk').values_list('pk', flat=True))
+        missing = extra = changed = 0
+        drifted_users = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            expected = {
+                (row['user'], row['ingredient']): row['total']
+                for row in ShoppingListItem.objects.expected_totals(batch)
+            }
+            stored = {
+                (user, ingredient): total
+                for user, ingredient, total
+                in ShoppingListItem.objects.filter(
+                    user__in=batch
+                ).values_list('user', 'ingredient', 'total')
+            }
+            batch_missing = expected.keys() - stored.keys()
+            batch_extra = stored.keys() - expected.keys()
+            batch_changed = {
+                key for key in expected.keys() & stored.keys()
+                if expected[key] != stored[key]
+            }
+            missing += len(batch_missing)
+            extra += len(batch_extra)
+            changed += len(batch_changed)
+            users = {
+                user for user, _ in batch_missing | batch_extra | batch_changed
+            }
+            drifted_users += len(users)
+            if users and not options['dry_run']:
+                ShoppingListItem.objects.refresh(sorted(users))
+
+        self.stdout.write(
+            f'Пользователей проверено: {len(user_ids)}, '
+            f'с расхождениями: {drifted_users}\n'
+            f'Нет позиции: {missing}, лишних позиций: {extra}, '
+            f'неверная сумма: {changed}'
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Проверка завершена'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Списки покупок пересчитаны'))
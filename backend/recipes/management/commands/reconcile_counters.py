@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from recipes.constants import COUNTERS_BATCH_SIZE
+from recipes.counters import COUNTERS, iterate_batches, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        ' Сверить счётчики избранного, корзин и рецептов автора '
+        'с настоящими данными и исправить расхождения '
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=COUNTERS_BATCH_SIZE,
+            help='Сколько объектов сверять за один проход',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Старт команды'))
+        for model, counters in COUNTERS:
+            checked = drifted = 0
+            for queryset in iterate_batches(model, options['batch_size']):
+                checked += queryset.count()
+                drifted += reconcile_counters(
+                    queryset, counters, options['dry_run']
+                )
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: проверено {checked}, '
+                f'с расхождениями {drifted} ({", ".join(counters)})'
+            )
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Проверка завершена'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:24
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Sum
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    rows = IngredientAmount.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values(
+        'ingredient',
+        user=F('recipe__shopping_cart__user'),
+    ).annotate(total=Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row['user'],
+                ingredient_id=row['ingredient'],
+                total=row['total'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0011_alter_ingredientamount_amount'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredientamount',
+            name='ingredient',
+            field=models.ForeignKey(max_length=254, on_delete=django.db.models.deletion.CASCADE, related_name='amount_ingredients', to='recipes.ingredients', verbose_name='Ингредиент'),
+        ),
+        migrations.AlterField(
+            model_name='ingredients',
+            name='name',
+            field=models.CharField(max_length=254, verbose_name='Название ингредиента'),
+        ),
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredients', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Списки покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
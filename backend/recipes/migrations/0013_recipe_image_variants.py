@@ -0,0 +1,28 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_card',
+            field=models.ImageField(blank=True, upload_to='images/variants/', verbose_name='Изображение для карточки'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='Хэш изображения'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, upload_to='images/variants/', verbose_name='Миниатюра'),
+        ),
+    ]
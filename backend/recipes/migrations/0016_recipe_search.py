@@ -0,0 +1,73 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:36
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_search_documents(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    last_id = 0
+    while True:
+        recipes = list(Recipe.objects.filter(
+            id__gt=last_id
+        ).order_by('id').only('id', 'text')[:BATCH_SIZE])
+        if not recipes:
+            return
+        names = defaultdict(list)
+        for recipe_id, name in IngredientAmount.objects.filter(
+            recipe__in=recipes
+        ).order_by('id').values_list('recipe_id', 'ingredient__name'):
+            names[recipe_id].append(name)
+        for recipe in recipes:
+            recipe.search_document = '\n'.join(
+                (recipe.text, *names[recipe.id])
+            )
+        Recipe.objects.bulk_update(recipes, ('search_document',))
+        last_id = recipes[-1].id
+
+
+def create_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector '
+        "GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('russian'::regconfig, name), 'A') || "
+        "setweight(to_tsvector('russian'::regconfig, search_document), 'B')"
+        ") STORED"
+    )
+    schema_editor.execute(
+        'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+        'USING GIN (search_vector)'
+    )
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE recipes_recipe DROP COLUMN search_vector'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, verbose_name='Текст для поиска'),
+        ),
+        migrations.RunPython(
+            fill_search_documents, migrations.RunPython.noop
+        ),
+        migrations.RunPython(create_search_vector, drop_search_vector),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:38
+
+from collections import defaultdict
+
+from django.db import migrations, models
+import recipes.ingredient_sets
+
+BATCH_SIZE = 1000
+
+
+def fill_ingredient_sets(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    last_id = 0
+    while True:
+        recipes = list(Recipe.objects.filter(
+            id__gt=last_id
+        ).order_by('id').only('id')[:BATCH_SIZE])
+        if not recipes:
+            return
+        ingredient_ids = defaultdict(set)
+        for recipe_id, ingredient_id in IngredientAmount.objects.filter(
+            recipe__in=recipes
+        ).values_list('recipe_id', 'ingredient_id'):
+            ingredient_ids[recipe_id].add(ingredient_id)
+        for recipe in recipes:
+            recipe.ingredient_ids = sorted(ingredient_ids[recipe.id])
+            recipe.ingredients_count = len(recipe.ingredient_ids)
+        Recipe.objects.bulk_update(
+            recipes, ('ingredient_ids', 'ingredients_count')
+        )
+        last_id = recipes[-1].id
+
+
+def create_ingredient_set_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX recipe_ingredient_ids_idx ON recipes_recipe '
+        'USING GIN (ingredient_ids)'
+    )
+
+
+def drop_ingredient_set_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX recipe_ingredient_ids_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_ids',
+            field=recipes.ingredient_sets.IngredientSetField(blank=True, default=list, editable=False, verbose_name='Набор ингредиентов'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Число ингредиентов'),
+        ),
+        migrations.RunPython(
+            fill_ingredient_sets, migrations.RunPython.noop
+        ),
+        migrations.RunPython(
+            create_ingredient_set_index, drop_ingredient_set_index
+        ),
+    ]
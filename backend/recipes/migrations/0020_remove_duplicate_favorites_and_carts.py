@@ -0,0 +1,71 @@
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import Coalesce
+
+
+def count(model, field):
+    return Coalesce(models.Subquery(
+        model.objects.filter(
+            **{field: models.OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=models.Count('pk')
+        ).values('count'),
+        output_field=models.IntegerField(),
+    ), 0)
+
+
+def remove_duplicates(apps, schema_editor):
+    affected_users = set()
+    affected_recipes = set()
+    for model_name in ('Favorites', 'ShoppingCart'):
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.values('user', 'recipe').annotate(
+            keep_id=Min('id'), rows=Count('id')
+        ).filter(rows__gt=1).order_by()
+        for row in duplicates.iterator():
+            model.objects.filter(
+                user=row['user'], recipe=row['recipe']
+            ).exclude(id=row['keep_id']).delete()
+            affected_recipes.add(row['recipe'])
+            if model_name == 'ShoppingCart':
+                affected_users.add(row['user'])
+    # Счётчики из 0019 посчитаны вместе с дублями
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.filter(pk__in=affected_recipes).update(
+        favorites_count=count(apps.get_model('recipes', 'Favorites'), 'recipe'),
+        in_carts_count=count(apps.get_model('recipes', 'ShoppingCart'), 'recipe'),
+    )
+    if not affected_users:
+        return
+
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    ShoppingListItem.objects.filter(user__in=affected_users).delete()
+    rows = IngredientAmount.objects.filter(
+        recipe__shopping_cart__user__in=affected_users
+    ).values(
+        'ingredient',
+        user=F('recipe__shopping_cart__user'),
+    ).annotate(total=Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row['user'],
+                ingredient_id=row['ingredient'],
+                total=row['total'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 3.2.3 on 2026-10-18 20:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+from recipes.constants import FEED_BACKFILL_LIMIT, FEED_FANOUT_MAX_FOLLOWERS
+
+
+def fill_feeds(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    Subscriber = apps.get_model('users', 'Subscriber')
+    popular = list(Subscriber.objects.values('subscriber').annotate(
+        followers=Count('pk')
+    ).filter(
+        followers__gt=FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('subscriber', flat=True))
+    Recipe.objects.filter(author__in=popular).update(fanned_out=False)
+    subscriptions = Subscriber.objects.exclude(
+        subscriber__in=popular
+    ).values_list('author', 'subscriber')
+    for user_id, author_id in subscriptions.iterator():
+        FeedEntry.objects.bulk_create(
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for recipe_id, pub_date in Recipe.objects.filter(
+                author_id=author_id
+            ).order_by('-pub_date', '-id').values_list(
+                'id', 'pub_date'
+            )[:FEED_BACKFILL_LIMIT]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0021_favorites_shoppingcart_unique'),
+        ('users', '0003_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Время публикации')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Ленты',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fanned_out',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Разослан по лентам'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['-pub_date', '-id'], name='recipe_unfanned_pub_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта'),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['author', 'user'], name='feed_author_user_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_user_recipe'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+from recipes.search import sqlite_search_operation
+
+
+class Migration(migrations.Migration):
+    """Индекс FTS5 для поиска рецептов в SQLite.
+
+    Раньше создавался обработчиком post_migrate, поэтому
+    в существующих базах таблица и триггеры уже могут быть.
+    """
+
+    dependencies = [
+        ('recipes', '0024_ingredient_name_trigram_index'),
+    ]
+
+    operations = [
+        sqlite_search_operation(),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def drop_trigram_index(apps, schema_editor):
+    # Поиск по подстроке идёт по словарю триграмм в памяти процесса
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS ingredient_name_trgm_idx')
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX ingredient_name_trgm_idx ON recipes_ingredients '
+        'USING GIN ((UPPER(name::text)) gin_trgm_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0025_recipe_search_sqlite'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_trigram_index, create_trigram_index),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Выражение совпадает с тем, что Django строит для name__istartswith
+    schema_editor.execute(
+        'CREATE INDEX ingredient_name_prefix_idx ON recipes_ingredients '
+        '((UPPER(name::text)) text_pattern_ops)'
+    )
+
+
+def drop_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS ingredient_name_prefix_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0026_drop_ingredient_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
@@ -1,10 +1,21 @@
+from collections import defaultdict
+
 from colorfield.fields import ColorField
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import Exists, OuterRef
-from recipes.constants import (MAX_CHAR_LENGTH_254, MAX_COLOR_LENGTH,
+from django.db import connection, models, transaction
+from django.db.models import (Exists, ExpressionWrapper, F, FloatField,
+                              OuterRef, Prefetch, Subquery, Sum, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, RowNumber
+from django.utils import timezone
+from recipes.constants import (COMPUTED_FIELDS_BATCH_SIZE, FEED_BACKFILL_LIMIT,
+                               FEED_FANOUT_MAX_FOLLOWERS, IMAGE_HASH_LENGTH,
+                               MAX_CHAR_LENGTH_254, MAX_COLOR_LENGTH,
                                MAX_LENGTH_200, MEASUREMENT_UNITS_LENGTH)
-from users.models import User
+from recipes.ingredient_sets import (IngredientSetField,
+                                     ingredient_set_expressions)
+from recipes.search import apply_search, build_search_document
+from users.models import Subscriber, User
 
 
 class Tag(models.Model):
@@ -59,8 +70,9 @@ class Ingredients(models.Model):
 
 
 class RecipeQuerySet(models.QuerySet):
-    def with_favorites_and_shopping_cart(self, user):
-        return self.prefetch_related('tags', 'ingredients').annotate(
+    def with_user_flags(self, user):
+        """Флаги избранного и корзины для конкретного пользователя"""
+        return self.annotate(
             is_favorited=Exists(Favorites.objects.filter(
                 user=user,
                 recipe=OuterRef('pk')
@@ -71,6 +83,129 @@ class RecipeQuerySet(models.QuerySet):
             ))
         )
 
+    def with_related(self):
+        """Связанные объекты, которые читает сериализатор рецепта"""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'amount_ingredients',
+                queryset=IngredientAmount.objects.select_related('ingredient'),
+            ),
+        )
+
+    def with_favorites_and_shopping_cart(self, user):
+        return self.with_related().with_user_flags(user)
+
+    def with_tags(self, tag_ids, match_all=False):
+        """Рецепты с любым или со всеми тегами, без JOIN и DISTINCT"""
+        if not tag_ids:
+            return self.none()
+        tags = Recipe.tags.through.objects.filter(recipe=OuterRef('pk'))
+        if not match_all:
+            return self.filter(Exists(tags.filter(tag_id__in=tag_ids)))
+        queryset = self
+        for tag_id in set(tag_ids):
+            queryset = queryset.filter(Exists(tags.filter(tag_id=tag_id)))
+        return queryset
+
+    def search(self, query):
+        """Полнотекстовый поиск, самые релевантные рецепты первыми"""
+        queryset = apply_search(self, query)
+        if queryset is None:
+            return self.none()
+        return queryset.order_by('-search_rank', '-pub_date', '-id')
+
+    def cookable_with(self, ingredient_ids, missing=0):
+        """Рецепты, для которых не хватает не больше missing ингредиентов.
+
+        Хотя бы один ингредиент рецепта должен быть в наборе. Первыми
+        идут рецепты с наибольшей долей имеющихся ингредиентов.
+        """
+        condition, matched = ingredient_set_expressions(
+            connection.ops.quote_name(self.model._meta.db_table),
+            sorted(set(ingredient_ids)),
+            missing,
+        )
+        queryset = self.filter(ingredients_count__gt=0)
+        if condition is not None:
+            queryset = queryset.filter(condition)
+        return queryset.annotate(
+            ingredients_matched=matched,
+        ).annotate(
+            ingredients_missing=(
+                F('ingredients_count') - F('ingredients_matched')
+            ),
+            ingredients_coverage=ExpressionWrapper(
+                Cast('ingredients_matched', FloatField())
+                / F('ingredients_count'),
+                output_field=FloatField(),
+            ),
+        ).filter(
+            ingredients_matched__gt=0,
+            ingredients_missing__lte=missing,
+        ).order_by(
+            '-ingredients_coverage', 'ingredients_missing', '-pub_date', '-id'
+        )
+
+    def update_computed_fields(self):
+        """Пересобирает поисковый текст и набор ингредиентов рецептов.
+
+        Заодно отмечает рецепты изменёнными: отдельный touch() после
+        этого не нужен.
+        """
+        now = timezone.now()
+        recipes = list(self.only('id', 'text'))
+        ingredients = defaultdict(list)
+        for recipe_id, ingredient_id, name in IngredientAmount.objects.filter(
+            recipe__in=recipes
+        ).order_by('id').values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name'
+        ):
+            ingredients[recipe_id].append((ingredient_id, name))
+        for recipe in recipes:
+            recipe_ingredients = ingredients[recipe.id]
+            recipe.search_document = build_search_document(
+                recipe.text, (name for _, name in recipe_ingredients)
+            )
+            recipe.ingredient_ids = sorted(
+                ingredient_id for ingredient_id, _ in recipe_ingredients
+            )
+            recipe.ingredients_count = len(recipe_ingredients)
+            recipe.updated_at = now
+        Recipe.objects.bulk_update(
+            recipes,
+            (
+                'search_document', 'ingredient_ids', 'ingredients_count',
+                'updated_at',
+            ),
+            batch_size=COMPUTED_FIELDS_BATCH_SIZE,
+        )
+
+    def touch(self):
+        """Отмечает рецепты изменёнными, например после правки тегов"""
+        return self.update(updated_at=timezone.now())
+
+    def similar_to(self, recipe_id):
+        """Рецепты с похожим набором ингредиентов, самые похожие первыми"""
+        return self.filter(similar_to__recipe_id=recipe_id).order_by(
+            '-similar_to__similarity', '-id'
+        )
+
+    def limited_per_author(self, limit):
+        """Не больше limit последних рецептов каждого автора одним запросом"""
+        ranked = self.annotate(
+            author_rank=Window(
+                expression=RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            )
+        ).order_by().values('id', 'author_rank')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(id__in=RawSQL(
+            f'SELECT id FROM ({sql}) ranked WHERE author_rank <= %s',
+            (*params, limit),
+        ))
+
 
 class Recipe(models.Model):
     """Модель рецептов"""
@@ -79,6 +214,7 @@ class Recipe(models.Model):
         related_name='recipes',
         on_delete=models.SET_NULL,
         null=True,
+        db_index=False,
     )
     name = models.CharField(
         max_length=MAX_LENGTH_200,
@@ -90,6 +226,22 @@ class Recipe(models.Model):
         upload_to='images/',
         blank=False,
     )
+    image_hash = models.CharField(
+        max_length=IMAGE_HASH_LENGTH,
+        verbose_name='Хэш изображения',
+        blank=True,
+        db_index=True,
+    )
+    image_thumbnail = models.ImageField(
+        verbose_name='Миниатюра',
+        upload_to='images/variants/',
+        blank=True,
+    )
+    image_card = models.ImageField(
+        verbose_name='Изображение для карточки',
+        upload_to='images/variants/',
+        blank=True,
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
         blank=False,
@@ -115,14 +267,67 @@ class Recipe(models.Model):
         verbose_name='Время публикации',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Время изменения',
+        auto_now=True,
+    )
+    search_document = models.TextField(
+        verbose_name='Текст для поиска',
+        blank=True,
+        editable=False,
+    )
+    ingredient_ids = IngredientSetField(
+        verbose_name='Набор ингредиентов',
+        default=list,
+        blank=True,
+        editable=False,
+    )
+    ingredients_count = models.PositiveSmallIntegerField(
+        verbose_name='Число ингредиентов',
+        default=0,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        default=0,
+        editable=False,
+    )
+    fanned_out = models.BooleanField(
+        verbose_name='Разослан по лентам',
+        default=True,
+        editable=False,
+    )
     objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+                condition=models.Q(author__isnull=False),
+            ),
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_unfanned_pub_date_idx',
+                condition=models.Q(fanned_out=False),
+            ),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
     def __str__(self):
+        if self.author is None:
+            return self.name
         return f'{self.name} - {self.author.username}'
 
 
@@ -163,11 +368,55 @@ class IngredientAmount(models.Model):
     def __str__(self):
         return (
             f'{self.recipe.name} - {self.ingredient.name} '
-            f'{self.amount}{self.ingredient.measurement_unit} '
-            f'{self.ingredient.name}'
+            f'{self.amount}{self.ingredient.measurement_unit}'
         )
 
 
+class UserRecipeQuerySet(models.QuerySet):
+    """Пачечное изменение избранного и корзины одним запросом к БД.
+
+    Запросы выполняются в обход сигналов моделей, поэтому
+    вызывающий код сам обновляет всё, что от них зависит.
+    """
+    def add_recipes(self, user_id, recipe_ids):
+        """Добавляет существующие рецепты и возвращает id добавленных.
+
+        Уже добавленные рецепты пропускаются благодаря
+        уникальному ограничению, поэтому одновременные запросы
+        не создают дублей.
+        """
+        if not recipe_ids:
+            return []
+        quote = connection.ops.quote_name
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'(user_id, recipe_id) '
+                f'SELECT %s, id FROM {quote(Recipe._meta.db_table)} '
+                f'WHERE id IN ({placeholders}) '
+                f'ON CONFLICT (user_id, recipe_id) DO NOTHING '
+                f'RETURNING recipe_id',
+                [user_id, *recipe_ids],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def remove_recipes(self, user_id, recipe_ids):
+        """Удаляет рецепты и возвращает id удалённых"""
+        if not recipe_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM '
+                f'{connection.ops.quote_name(self.model._meta.db_table)} '
+                f'WHERE user_id = %s AND recipe_id IN ({placeholders}) '
+                f'RETURNING recipe_id',
+                [user_id, *recipe_ids],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
 class Favorites(models.Model):
     """Модель избранных рецепотв"""
     user = models.ForeignKey(
@@ -182,8 +431,15 @@ class Favorites(models.Model):
         related_name='favorites',
         verbose_name='Рецепт'
     )
+    objects = UserRecipeQuerySet.as_manager()
 
     class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite_user_recipe',
+            ),
+        )
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
 
@@ -202,7 +458,365 @@ class ShoppingCart(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепт'
     )
+    objects = UserRecipeQuerySet.as_manager()
 
     class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart_user_recipe',
+            ),
+        )
         verbose_name = 'Корзина покупок'
         verbose_name_plural = 'Корзины покупок'
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    def expected_totals(self, user_ids):
+        """Суммы ингредиентов в корзинах пользователей, посчитанные заново"""
+        return IngredientAmount.objects.filter(
+            recipe__shopping_cart__user__in=user_ids
+        ).values(
+            'ingredient',
+            user=F('recipe__shopping_cart__user'),
+        ).annotate(total=Sum('amount')).order_by()
+
+    def add_recipes(self, user_id, recipe_ids):
+        """Прибавляет к списку покупок ингредиенты рецептов"""
+        if not recipe_ids:
+            return
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, total) '
+                f'SELECT %s, ingredient_id, SUM(amount) '
+                f'FROM {quote(IngredientAmount._meta.db_table)} '
+                f'WHERE recipe_id IN ({placeholders}) '
+                f'GROUP BY ingredient_id '
+                f'ON CONFLICT (user_id, ingredient_id) '
+                f'DO UPDATE SET total = {table}.total + EXCLUDED.total',
+                [user_id, *recipe_ids],
+            )
+
+    def remove_recipes(self, user_id, recipe_ids):
+        """Вычитает из списка покупок ингредиенты рецептов"""
+        if not recipe_ids:
+            return
+        amounts = IngredientAmount.objects.filter(
+            recipe__in=recipe_ids,
+            ingredient=OuterRef('ingredient'),
+        ).order_by().values('ingredient').annotate(
+            total=Sum('amount')
+        ).values('total')
+        with transaction.atomic():
+            self.filter(
+                user_id=user_id,
+                ingredient__in=IngredientAmount.objects.filter(
+                    recipe__in=recipe_ids
+                ).values('ingredient'),
+            ).update(total=F('total') - Subquery(amounts))
+            self.filter(user_id=user_id, total__lte=0).delete()
+
+    def apply_deltas(self, deltas):
+        """Переносит в списки покупок изменения состава рецептов.
+
+        deltas - словарь {(id рецепта, id ингредиента): изменение
+        количества}. Изменение прибавляется к спискам всех, у кого
+        рецепт в корзине, одним INSERT ... ON CONFLICT DO UPDATE,
+        ставшие пустыми позиции удаляются.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        values = ', '.join(['(%s, %s, %s)'] * len(deltas))
+        params = [
+            value
+            for (recipe_id, ingredient_id), delta in deltas.items()
+            for value in (recipe_id, ingredient_id, delta)
+        ]
+        recipe_ids = {recipe_id for recipe_id, _ in deltas}
+        with transaction.atomic(savepoint=False):
+            with connection.cursor() as cursor:
+                # Столбцы VALUES называются column1, column2, ...
+                # и в PostgreSQL, и в SQLite
+                cursor.execute(
+                    f'INSERT INTO {table} (user_id, ingredient_id, total) '
+                    f'SELECT cart.user_id, delta.column2, SUM(delta.column3) '
+                    f'FROM {quote(ShoppingCart._meta.db_table)} cart '
+                    f'JOIN (VALUES {values}) delta '
+                    f'ON cart.recipe_id = delta.column1 '
+                    f'GROUP BY cart.user_id, delta.column2 '
+                    f'ON CONFLICT (user_id, ingredient_id) '
+                    f'DO UPDATE SET total = {table}.total + EXCLUDED.total',
+                    params,
+                )
+            self.filter(
+                user__in=ShoppingCart.objects.filter(
+                    recipe__in=recipe_ids
+                ).values('user'),
+                ingredient__in={ingredient_id for _, ingredient_id in deltas},
+                total__lte=0,
+            ).delete()
+
+    def refresh(self, user_ids):
+        """Пересчитывает списки покупок пользователей по их корзинам"""
+        with transaction.atomic():
+            self.filter(user__in=user_ids).delete()
+            self.bulk_create(
+                self.model(
+                    user_id=row['user'],
+                    ingredient_id=row['ingredient'],
+                    total=row['total'],
+                )
+                for row in self.expected_totals(user_ids)
+            )
+
+
+class ShoppingListItem(models.Model):
+    """Модель списка покупок: сумма ингредиента во всей корзине
+       пользователя, обновляется при изменении корзины"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredients,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    total = models.IntegerField(
+        verbose_name='Количество',
+    )
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item',
+            ),
+        )
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient} {self.total}'
+
+
+class FeedQuerySet(models.QuerySet):
+    def fan_out(self, recipe):
+        """Раскладывает новый рецепт по лентам подписчиков автора.
+
+        Вставка выполняется одним INSERT ... SELECT по подпискам.
+        Рецепты авторов, у которых больше FEED_FANOUT_MAX_FOLLOWERS
+        подписчиков, не раскладываются: лента читает их сама.
+        Записи, которые уже добавил параллельный backfill, пропускаются.
+        """
+        followers = Subscriber.objects.filter(
+            subscriber_id=recipe.author_id
+        ).order_by()
+        if followers[:FEED_FANOUT_MAX_FOLLOWERS + 1].count() > (
+            FEED_FANOUT_MAX_FOLLOWERS
+        ):
+            recipe.fanned_out = False
+            Recipe.objects.filter(pk=recipe.pk).update(fanned_out=False)
+            return
+        quote = connection.ops.quote_name
+        recipes = quote(Recipe._meta.db_table)
+        subscribers = quote(Subscriber._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'(user_id, recipe_id, author_id, pub_date) '
+                f'SELECT {subscribers}.author_id, {recipes}.id, '
+                f'{recipes}.author_id, {recipes}.pub_date '
+                f'FROM {recipes} JOIN {subscribers} '
+                f'ON {subscribers}.subscriber_id = {recipes}.author_id '
+                f'WHERE {recipes}.id = %s '
+                f'ON CONFLICT (user_id, recipe_id) DO NOTHING',
+                [recipe.pk],
+            )
+
+    def backfill(self, user_id, author_id):
+        """Добавляет в ленту последние рецепты автора после подписки"""
+        recent = Recipe.objects.filter(
+            author_id=author_id, fanned_out=True
+        ).order_by('-pub_date', '-id').values(
+            'id', 'author_id', 'pub_date'
+        )[:FEED_BACKFILL_LIMIT]
+        sql, params = recent.query.sql_with_params()
+        # В SQLite ON CONFLICT после INSERT ... SELECT разбирается
+        # как часть JOIN, если у SELECT нет WHERE, поэтому условие
+        # WHERE 1 = 1 обязательно
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO '
+                f'{connection.ops.quote_name(self.model._meta.db_table)} '
+                f'(user_id, recipe_id, author_id, pub_date) '
+                f'SELECT %s, id, author_id, pub_date FROM ({sql}) recent '
+                f'WHERE 1 = 1 '
+                f'ON CONFLICT (user_id, recipe_id) DO NOTHING',
+                (user_id, *params),
+            )
+
+    def trim(self, user_id, author_id):
+        """Убирает из ленты рецепты автора после отписки"""
+        return self.filter(user_id=user_id, author_id=author_id).delete()
+
+    def page_keys(self, user, before, limit):
+        """Дата и id рецептов страницы ленты, самые новые первыми.
+
+        Страница собирается из двух выборок по индексам, каждая
+        не больше limit строк: записи ленты пользователя и рецепты
+        его авторов, которые не раскладывались по лентам. Время
+        не зависит от числа подписок и от глубины страницы.
+        """
+        entries = self.filter(user=user)
+        recipes = Recipe.objects.filter(
+            fanned_out=False,
+            author__in=Subscriber.objects.filter(
+                author=user
+            ).values('subscriber'),
+        )
+        if before is not None:
+            pub_date, recipe_id = before
+            entries = entries.filter(
+                models.Q(pub_date__lt=pub_date)
+                | models.Q(pub_date=pub_date, recipe_id__lt=recipe_id)
+            )
+            recipes = recipes.filter(
+                models.Q(pub_date__lt=pub_date)
+                | models.Q(pub_date=pub_date, id__lt=recipe_id)
+            )
+        keys = set(entries.order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id'
+        )[:limit])
+        keys.update(recipes.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id'
+        )[:limit])
+        return sorted(keys, reverse=True)[:limit]
+
+
+class FeedEntry(models.Model):
+    """Запись ленты: рецепт автора, на которого подписан пользователь.
+
+    Дата публикации и автор копируются из рецепта, чтобы страница
+    ленты читалась одним проходом по индексу.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Пользователь',
+        db_index=False,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта',
+        db_index=False,
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Время публикации',
+    )
+    objects = FeedQuerySet.as_manager()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_user_recipe',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=('author', 'user'),
+                name='feed_author_user_idx',
+            ),
+        )
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты'
+
+
+class RecipeBand(models.Model):
+    """Ключ полосы LSH подписи MinHash набора ингредиентов рецепта.
+
+    Рецепты с одинаковым ключом хотя бы в одной полосе становятся
+    кандидатами в похожие.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='bands',
+        verbose_name='Рецепт',
+    )
+    band = models.PositiveSmallIntegerField(
+        verbose_name='Номер полосы',
+    )
+    key = models.BigIntegerField(
+        verbose_name='Ключ полосы',
+    )
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('band', 'key'),
+                name='recipe_band_key_idx',
+            ),
+        )
+        verbose_name = 'Полоса LSH рецепта'
+        verbose_name_plural = 'Полосы LSH рецептов'
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт и коэффициент Жаккара их наборов ингредиентов"""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+        db_index=False,
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт',
+    )
+    similarity = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('recipe', '-similarity'),
+                name='similar_recipe_similarity_idx',
+            ),
+        )
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
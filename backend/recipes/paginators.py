@@ -0,0 +1,34 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from recipes.constants import ADMIN_APPROXIMATE_COUNT_MIN
+
+
+class ApproximateCountPaginator(Paginator):
+    """Пагинатор админки, который не считает большие таблицы целиком.
+
+    Для списка без фильтров в PostgreSQL число записей берётся
+    из статистики планировщика: COUNT(*) по большой таблице читает
+    её всю. Оценка используется, только если она не меньше
+    ADMIN_APPROXIMATE_COUNT_MIN, иначе записи считаются точно.
+    """
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = self.estimate(self.object_list)
+            if estimate >= ADMIN_APPROXIMATE_COUNT_MIN:
+                return estimate
+        return super().count
+
+    def estimate(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                (queryset.model._meta.db_table,),
+            )
+            row = cursor.fetchone()
+        return int(row[0]) if row else 0
@@ -0,0 +1,187 @@
+import re
+
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+from recipes.models import (Favorites, FeedEntry, IngredientAmount,
+                            Ingredients, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from users.models import Subscriber, User
+
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(
+        r'\bSCAN (?:TABLE )?(\w+)(?: AS \w+)?(?! USING)(?:\s|$)'
+    ),
+}
+SUBQUERY_ALIAS = re.compile(r'[A-Z]\d+')
+
+
+def get_checks():
+    """Запросы горячих путей.
+
+    Для каждого указаны таблицы, которые нельзя читать целиком,
+    и индексы, которые обязательно должны попасть в план.
+    Параметры выбраны избирательными, чтобы на данных
+    create_sample_data индекс был дешевле полного чтения.
+    Поиск по набору ингредиентов индексируется только в PostgreSQL.
+    """
+    user = User.objects.order_by('id').first()
+    recipe = Recipe.objects.order_by('-pub_date', '-id')[10]
+    tag_ids = list(Tag.objects.values_list('id', flat=True)[:2])
+    ingredient_ids = list(
+        Ingredients.objects.values_list('id', flat=True)[:10]
+    )
+    return (
+        (
+            'Лента рецептов',
+            Recipe.objects.order_by('-pub_date', '-id')[:6],
+            ('recipes_recipe',),
+            ('recipe_pub_date_id_idx',),
+        ),
+        (
+            'Следующая страница по курсору',
+            Recipe.objects.filter(
+                Q(pub_date__lt=recipe.pub_date)
+                | Q(pub_date=recipe.pub_date, id__lt=recipe.id)
+            ).order_by('-pub_date', '-id')[:6],
+            ('recipes_recipe',),
+            (),
+        ),
+        (
+            'Последние рецепты автора',
+            Recipe.objects.filter(
+                author=recipe.author_id
+            ).order_by('-pub_date', '-id')[:3],
+            ('recipes_recipe',),
+            ('recipe_author_pub_date_idx',),
+        ),
+        (
+            'Лента подписок',
+            FeedEntry.objects.filter(user=user).order_by(
+                '-pub_date', '-recipe_id'
+            ).values_list('pub_date', 'recipe_id')[:7],
+            ('recipes_feedentry',),
+            ('feed_user_pub_date_idx',),
+        ),
+        (
+            'Популярные авторы в ленте подписок',
+            Recipe.objects.filter(
+                fanned_out=False,
+                author__in=Subscriber.objects.filter(
+                    author=user
+                ).values('subscriber'),
+            ).order_by('-pub_date', '-id').values_list('pub_date', 'id')[:7],
+            # Годятся и частичный индекс, и индекс по автору:
+            # планировщик выбирает по числу подписок
+            ('recipes_recipe',),
+            (),
+        ),
+        (
+            'Похожие рецепты',
+            Recipe.objects.similar_to(recipe.id)[:10],
+            ('recipes_similarrecipe',),
+            ('similar_recipe_similarity_idx',),
+        ),
+        (
+            'Флаги избранного и корзины',
+            Recipe.objects.filter(
+                id=recipe.id
+            ).with_user_flags(user),
+            ('recipes_favorites', 'recipes_shoppingcart'),
+            (),
+        ),
+        (
+            'Проверка перед добавлением в избранное',
+            Favorites.objects.filter(user=user, recipe=recipe),
+            ('recipes_favorites',),
+            (),
+        ),
+        (
+            'Проверка перед добавлением в корзину',
+            ShoppingCart.objects.filter(user=user, recipe=recipe),
+            ('recipes_shoppingcart',),
+            (),
+        ),
+        (
+            'Фильтр по тегам',
+            Recipe.objects.filter(Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef('pk'), tag__in=tag_ids
+                )
+            )).order_by('-pub_date', '-id')[:6],
+            ('recipes_recipe_tags',),
+            (),
+        ),
+        (
+            'Поиск по тексту',
+            Recipe.objects.search(recipe.name)[:6],
+            ('recipes_recipe',),
+            (),
+        ),
+        (
+            'Рецепты из имеющихся ингредиентов',
+            Recipe.objects.cookable_with(ingredient_ids)[:6],
+            ('recipes_recipe',) if connection.vendor == 'postgresql' else (),
+            (),
+        ),
+        (
+            'Избранное пользователя',
+            Recipe.objects.filter(favorites__user=user),
+            ('recipes_favorites',),
+            (),
+        ),
+        (
+            'Ингредиенты страницы рецептов',
+            IngredientAmount.objects.filter(recipe__in=[recipe.id]),
+            ('recipes_ingredientamount',),
+            (),
+        ),
+        (
+            'Список покупок',
+            ShoppingListItem.objects.filter(user=user),
+            ('recipes_shoppinglistitem',),
+            (),
+        ),
+        (
+            'Подписки пользователя',
+            User.objects.filter(subscriber__author=user),
+            ('users_subscriber',),
+            (),
+        ),
+        (
+            'Проверка подписки',
+            Subscriber.objects.filter(author=user, subscriber=recipe.author),
+            ('users_subscriber',),
+            (),
+        ),
+    )
+
+
+def check_plan(pattern, queryset, tables, indexes):
+    """План запроса и список найденных в нём проблем"""
+    plan = queryset.explain()
+    errors = []
+    scanned = {
+        table for table in pattern.findall(plan)
+        if table in tables or SUBQUERY_ALIAS.fullmatch(table)
+    }
+    if scanned:
+        errors.append(f'полное чтение {", ".join(sorted(scanned))}')
+    unused = [index for index in indexes if index not in plan]
+    if unused:
+        errors.append(f'не использован {", ".join(unused)}')
+    return errors, plan
+
+
+def check_plans():
+    """Проверяет горячие запросы: [(название, проблемы, план)].
+
+    Планировщик работает с обычными настройками, поэтому проверка
+    ловит и случаи, когда по стоимости он выбирает полное чтение.
+    Перед вызовом в базе должна быть собрана статистика (ANALYZE).
+    """
+    pattern = SEQ_SCAN_PATTERNS[connection.vendor]
+    return [
+        (name, *check_plan(pattern, queryset, tables, indexes))
+        for name, queryset, tables, indexes in get_checks()
+    ]
@@ -0,0 +1,86 @@
+import threading
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from recipes.models import Tag
+
+
+class ReferenceCache:
+    """Справочник модели в памяти процесса.
+
+    Объекты хранятся в словарях по pk и по полям из lookups.
+    Версия справочника лежит в общем кэше: при изменении модели она
+    меняется, и каждый воркер перечитывает справочник не позднее
+    REFERENCE_CACHE_CHECK_INTERVAL секунд.
+    """
+    def __init__(self, model, lookups=()):
+        self.model = model
+        self.lookups = lookups
+        self.version_key = f'reference:{model._meta.label_lower}:version'
+        self._data = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def get_shared_version(self):
+        cache.add(self.version_key, uuid4().hex, timeout=None)
+        return cache.get(self.version_key)
+
+    def bump_version(self):
+        cache.set(self.version_key, uuid4().hex, timeout=None)
+
+    def invalidate(self):
+        """Сбрасывает справочник во всех процессах.
+
+        Новая версия публикуется только после фиксации транзакции:
+        иначе другой воркер может перечитать ещё старые строки
+        и держать их до следующего изменения.
+        """
+        transaction.on_commit(self.bump_version)
+        with self._lock:
+            self._data = None
+
+    def load(self):
+        return list(self.model.objects.all())
+
+    def build(self, objects):
+        data = {'objects': objects, 'pk': {obj.pk: obj for obj in objects}}
+        for field in self.lookups:
+            data[field] = {getattr(obj, field): obj for obj in objects}
+        return data
+
+    def get_data(self):
+        now = time.monotonic()
+        data = self._data
+        if (data is not None and now - self._checked_at
+                < settings.REFERENCE_CACHE_CHECK_INTERVAL):
+            return data
+        with self._lock:
+            version = self.get_shared_version()
+            if self._data is None or version != self._version:
+                self._data = self.build(self.load())
+                self._version = version
+            self._checked_at = now
+            return self._data
+
+    def all(self):
+        return self.get_data()['objects']
+
+    def get(self, pk):
+        return self.get_data()['pk'].get(pk)
+
+    def get_by(self, field, value):
+        return self.get_data()[field].get(value)
+
+    def get_many(self, pks):
+        by_pk = self.get_data()['pk']
+        return {pk: by_pk[pk] for pk in pks if pk in by_pk}
+
+
+tags_cache = ReferenceCache(Tag, lookups=('slug',))
@@ -0,0 +1,132 @@
+import random
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+from recipes.counters import COUNTERS, reconcile_counters
+from recipes.models import (Favorites, FeedEntry, IngredientAmount,
+                            Ingredients, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from recipes.similarity import rebuild_similar_recipes
+from users.models import Subscriber, User
+
+SAMPLE_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+def create_sample_data(users=50, recipes=2000, ingredients=500,
+                       ingredients_per_recipe=6, favorites_per_user=20,
+                       cart_per_user=5, subscriptions_per_user=10,
+                       batch_size=1000, seed=0):
+    """Заполняет пустую базу правдоподобными данными.
+
+    Записи создаются через bulk_create, поэтому сигналы не срабатывают:
+    списки покупок, счётчики и ленты заполняются в конце явно.
+    Используется для проверки планов запросов и замеров.
+    """
+    rng = random.Random(seed)
+    Tag.objects.bulk_create(
+        Tag(name=name, color=color, slug=slug)
+        for name, color, slug in SAMPLE_TAGS
+    )
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    Ingredients.objects.bulk_create(
+        (
+            Ingredients(name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(ingredients)
+        ),
+        batch_size=batch_size,
+    )
+    ingredient_ids = list(Ingredients.objects.values_list('id', flat=True))
+    User.objects.bulk_create(
+        (
+            User(
+                username=f'user{index}',
+                email=f'user{index}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+            )
+            for index in range(users)
+        ),
+        batch_size=batch_size,
+    )
+    user_ids = list(User.objects.values_list('id', flat=True))
+
+    now = timezone.now()
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author_id=rng.choice(user_ids),
+                name=f'Рецепт {index}',
+                text=f'Описание рецепта {index}',
+                cooking_time=rng.randint(1, 120),
+                image='images/sample.png',
+                pub_date=now - timedelta(minutes=index),
+            )
+            for index in range(recipes)
+        ),
+        batch_size=batch_size,
+    )
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    Recipe.tags.through.objects.bulk_create(
+        (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, rng.randint(1, len(tag_ids)))
+        ),
+        batch_size=batch_size,
+    )
+    IngredientAmount.objects.bulk_create(
+        (
+            IngredientAmount(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids,
+                min(ingredients_per_recipe, len(ingredient_ids)),
+            )
+        ),
+        batch_size=batch_size,
+    )
+    for model, per_user in (
+        (Favorites, favorites_per_user),
+        (ShoppingCart, cart_per_user),
+    ):
+        model.objects.bulk_create(
+            (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in rng.sample(
+                    recipe_ids, min(per_user, len(recipe_ids))
+                )
+            ),
+            batch_size=batch_size,
+        )
+    Subscriber.objects.bulk_create(
+        (
+            Subscriber(author_id=user_id, subscriber_id=author_id)
+            for user_id in user_ids
+            for author_id in rng.sample(
+                user_ids, min(subscriptions_per_user, len(user_ids))
+            )
+            if author_id != user_id
+        ),
+        batch_size=batch_size,
+    )
+    ShoppingListItem.objects.refresh(user_ids)
+    for user_id, author_id in Subscriber.objects.values_list(
+        'author', 'subscriber'
+    ).iterator():
+        FeedEntry.objects.backfill(user_id, author_id)
+    Recipe.objects.all().update_computed_fields()
+    for model, counters in COUNTERS:
+        reconcile_counters(model.objects.all(), counters)
+    rebuild_similar_recipes(batch_size)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
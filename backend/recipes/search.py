@@ -0,0 +1,120 @@
+import re
+
+from django.db import connection, migrations
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from recipes.constants import SEARCH_CONFIG, SEARCH_NAME_WEIGHT
+
+SQLITE_SEARCH_TABLE = 'recipes_recipe_search'
+WORD_RE = re.compile(r'\w+')
+
+SQLITE_SEARCH_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_search_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO {SQLITE_SEARCH_TABLE} (rowid, name, search_document)
+        VALUES (new.id, new.name, new.search_document);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_search_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO {SQLITE_SEARCH_TABLE}
+            ({SQLITE_SEARCH_TABLE}, rowid, name, search_document)
+        VALUES ('delete', old.id, old.name, old.search_document);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_search_update
+    AFTER UPDATE OF name, search_document ON recipes_recipe BEGIN
+        INSERT INTO {SQLITE_SEARCH_TABLE}
+            ({SQLITE_SEARCH_TABLE}, rowid, name, search_document)
+        VALUES ('delete', old.id, old.name, old.search_document);
+        INSERT INTO {SQLITE_SEARCH_TABLE} (rowid, name, search_document)
+        VALUES (new.id, new.name, new.search_document);
+    END
+    """,
+)
+
+SQLITE_SEARCH_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_SEARCH_TABLE} USING fts5('
+    "name, search_document, content='recipes_recipe', "
+    "content_rowid='id', tokenize='unicode61')",
+    *SQLITE_SEARCH_TRIGGERS,
+    f"INSERT INTO {SQLITE_SEARCH_TABLE} ({SQLITE_SEARCH_TABLE}) "
+    "VALUES ('rebuild')",
+)
+SQLITE_SEARCH_REVERSE_SQL = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_insert',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_delete',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_update',
+    f'DROP TABLE IF EXISTS {SQLITE_SEARCH_TABLE}',
+)
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    """RunSQL, который выполняется только в SQLite"""
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+
+
+def sqlite_search_operation():
+    """Индекс FTS5 по рецептам и триггеры, которые его обновляют.
+
+    В SQLite изменение полей рецепта в миграции пересоздаёт таблицу
+    и удаляет её триггеры, поэтому такая миграция должна заканчиваться
+    этой операцией: индекс будет построен заново.
+    """
+    return SQLiteRunSQL(SQLITE_SEARCH_SQL, SQLITE_SEARCH_REVERSE_SQL)
+
+
+def build_search_document(text, ingredient_names):
+    """Текст рецепта и названия ингредиентов для поискового индекса"""
+    return '\n'.join((text, *ingredient_names))
+
+
+def apply_search(queryset, query):
+    """Отбирает рецепты по запросу и добавляет релевантность search_rank.
+
+    Возвращает None, если в запросе нет ни одного слова.
+    В SQLite рецепты отбираются по rowid совпадений в индексе FTS5,
+    а релевантность считается подзапросом только для найденных.
+    """
+    words = WORD_RE.findall(query.lower())
+    if not words:
+        return None
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    if connection.vendor == 'postgresql':
+        tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+        params = (SEARCH_CONFIG, query)
+        return queryset.filter(RawSQL(
+            f'{table}.search_vector @@ {tsquery}', params,
+            output_field=BooleanField(),
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank({table}.search_vector, {tsquery})', params,
+            output_field=FloatField(),
+        ))
+    match = (
+        f'SELECT rowid FROM {SQLITE_SEARCH_TABLE} '
+        f'WHERE {SQLITE_SEARCH_TABLE} MATCH %s'
+    )
+    params = (' '.join(f'"{word}"*' for word in words),)
+    return queryset.filter(RawSQL(
+        f'{table}.id IN ({match})', params, output_field=BooleanField(),
+    )).annotate(search_rank=RawSQL(
+        f'(SELECT -bm25({SQLITE_SEARCH_TABLE}, {SEARCH_NAME_WEIGHT}, 1.0) '
+        f'FROM {SQLITE_SEARCH_TABLE} WHERE {SQLITE_SEARCH_TABLE} MATCH %s '
+        f'AND rowid = {table}.id)',
+        params, output_field=FloatField(),
+    ))
@@ -0,0 +1,117 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from users.models import Subscriber, User
+
+from .counters import RECIPE_COUNTER_FIELDS, change_counter
+from .ingredient_index import ingredient_index
+from .models import (Favorites, FeedEntry, Ingredients, Recipe, ShoppingCart,
+                     ShoppingListItem, Tag)
+from .reference_cache import tags_cache
+
+AUTHOR_FIELDS = frozenset(('email', 'username', 'first_name', 'last_name'))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.add_recipes(
+            instance.user_id, [instance.recipe_id]
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    ShoppingListItem.objects.remove_recipes(
+        instance.user_id, [instance.recipe_id]
+    )
+
+
+@receiver(post_save, sender=Favorites)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            RECIPE_COUNTER_FIELDS[sender], 1,
+        )
+
+
+@receiver(post_delete, sender=Favorites)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id),
+        RECIPE_COUNTER_FIELDS[sender], -1,
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created and instance.author_id is not None:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    if instance.author_id is not None:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created and instance.author_id is not None:
+        FeedEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Subscriber)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created:
+        FeedEntry.objects.backfill(instance.author_id, instance.subscriber_id)
+
+
+@receiver(post_delete, sender=Subscriber)
+def trim_feed(sender, instance, **kwargs):
+    FeedEntry.objects.trim(instance.author_id, instance.subscriber_id)
+
+
+@receiver(post_save, sender=Ingredients)
+@receiver(post_delete, sender=Ingredients)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags_cache(sender, **kwargs):
+    tags_cache.invalidate()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Recipe.objects.filter(pk=instance.pk).touch()
+    elif action in ('post_add', 'post_remove'):
+        Recipe.objects.filter(pk__in=pk_set).touch()
+    elif action == 'pre_clear':
+        Recipe.objects.filter(tags=instance).touch()
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields, **kwargs):
+    """Рецепты показывают автора, поэтому меняются вместе с ним"""
+    if created or (
+        update_fields and not AUTHOR_FIELDS.intersection(update_fields)
+    ):
+        return
+    Recipe.objects.filter(author=instance).touch()
+
+
+@receiver(pre_delete, sender=User)
+def touch_deleted_author_recipes(sender, instance, **kwargs):
+    Recipe.objects.filter(author=instance).touch()
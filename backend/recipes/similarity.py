@@ -0,0 +1,234 @@
+from collections import defaultdict
+from hashlib import blake2b
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Q
+from recipes.constants import (SIMILAR_BANDS, SIMILAR_BATCH_SIZE,
+                               SIMILAR_MAX_BUCKET_SIZE, SIMILAR_PERMUTATIONS,
+                               SIMILAR_RECIPES_LIMIT)
+from recipes.counters import iterate_batches
+from recipes.models import Recipe, RecipeBand, SimilarRecipe
+
+HASH_PRIME = (1 << 31) - 1
+
+
+def get_hash_coefficients():
+    """Коэффициенты хеш-функций MinHash.
+
+    Выводятся из номера функции, а не из генератора случайных чисел,
+    чтобы подписи не менялись между процессами и версиями NumPy.
+    """
+    values = [
+        int.from_bytes(
+            blake2b(f'minhash:{index}'.encode(), digest_size=8).digest(),
+            'big',
+        ) % HASH_PRIME
+        for index in range(2 * SIMILAR_PERMUTATIONS)
+    ]
+    first = np.array(values[:SIMILAR_PERMUTATIONS], dtype=np.uint64)
+    second = np.array(values[SIMILAR_PERMUTATIONS:], dtype=np.uint64)
+    return np.maximum(first, 1), second
+
+
+HASH_A, HASH_B = get_hash_coefficients()
+
+
+def get_signatures(ingredient_sets):
+    """Подписи MinHash непустых наборов ингредиентов, по строке на набор.
+
+    Хеши всех id считаются одной матричной операцией, а минимум
+    по каждому набору берётся через reduceat по границам наборов.
+    """
+    lengths = [len(ingredient_ids) for ingredient_ids in ingredient_sets]
+    ids = np.fromiter(
+        (
+            ingredient_id
+            for ingredient_ids in ingredient_sets
+            for ingredient_id in ingredient_ids
+        ),
+        dtype=np.uint64,
+        count=sum(lengths),
+    )
+    hashes = (ids[:, None] * HASH_A + HASH_B) % HASH_PRIME
+    offsets = np.cumsum([0] + lengths[:-1])
+    return np.minimum.reduceat(hashes, offsets, axis=0)
+
+
+def get_band_keys(signature):
+    """Ключи полос подписи: одинаковые полосы дают одинаковый ключ"""
+    return [
+        int.from_bytes(
+            blake2b(band.tobytes(), digest_size=8).digest(),
+            'big', signed=True,
+        )
+        for band in signature.reshape(SIMILAR_BANDS, -1)
+    ]
+
+
+def get_bands(ingredient_sets):
+    """Полосы LSH рецептов из словаря {id: набор ингредиентов}"""
+    recipe_ids = [
+        recipe_id for recipe_id, ingredient_ids in ingredient_sets.items()
+        if ingredient_ids
+    ]
+    if not recipe_ids:
+        return []
+    signatures = get_signatures(
+        [ingredient_sets[recipe_id] for recipe_id in recipe_ids]
+    )
+    return [
+        RecipeBand(recipe_id=recipe_id, band=band, key=key)
+        for recipe_id, signature in zip(recipe_ids, signatures)
+        for band, key in enumerate(get_band_keys(signature))
+    ]
+
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second)
+
+
+def get_neighbours(recipe_id, candidates, ingredient_sets):
+    """Самые похожие кандидаты рецепта: [(id, коэффициент Жаккара)]"""
+    ingredients = set(ingredient_sets[recipe_id])
+    scored = (
+        (candidate, jaccard(ingredients, set(ingredient_sets[candidate])))
+        for candidate in candidates if candidate != recipe_id
+    )
+    return sorted(
+        (row for row in scored if row[1] > 0),
+        key=lambda row: (-row[1], -row[0]),
+    )[:SIMILAR_RECIPES_LIMIT]
+
+
+def get_candidates(buckets):
+    """Кандидаты каждого рецепта по общим ключам полос.
+
+    Слишком большие корзины пропускаются: в них попадают рецепты
+    с самыми частыми ингредиентами, и они ничего не различают.
+    """
+    candidates = defaultdict(set)
+    for recipe_ids in buckets.values():
+        if len(recipe_ids) > SIMILAR_MAX_BUCKET_SIZE:
+            continue
+        for recipe_id in recipe_ids:
+            candidates[recipe_id].update(recipe_ids)
+    return candidates
+
+
+def get_keys_condition(keys):
+    """Условие на полосы с ключами из набора пар (полоса, ключ)"""
+    keys_by_band = defaultdict(list)
+    for band, key in keys:
+        keys_by_band[band].append(key)
+    condition = Q()
+    for band, band_keys in keys_by_band.items():
+        condition |= Q(band=band, key__in=band_keys)
+    return condition
+
+
+def get_buckets(keys, max_size):
+    """Корзины с ключами из keys, в которых не больше max_size рецептов.
+
+    Размер корзин считается в БД, поэтому участники больших корзин
+    не читаются.
+    """
+    if not keys:
+        return {}
+    small_keys = list(RecipeBand.objects.filter(
+        get_keys_condition(keys)
+    ).values('band', 'key').annotate(
+        size=Count('id')
+    ).filter(size__lte=max_size).values_list('band', 'key').order_by())
+    buckets = defaultdict(set)
+    if not small_keys:
+        return buckets
+    for recipe_id, band, key in RecipeBand.objects.filter(
+        get_keys_condition(small_keys)
+    ).values_list('recipe_id', 'band', 'key'):
+        buckets[band, key].add(recipe_id)
+    return buckets
+
+
+def update_similar_recipes(recipe_ids):
+    """Пересчитывает полосы и похожие рецепты после изменения рецептов.
+
+    Полосы рецептов заменяются. Списки похожих пересчитываются
+    у самих рецептов и у всех, с кем они делили корзину до или после
+    изменения: результат совпадает с rebuild_similar_recipes().
+    """
+    recipe_ids = set(recipe_ids)
+    ingredient_sets = dict(Recipe.objects.filter(
+        pk__in=recipe_ids
+    ).values_list('id', 'ingredient_ids'))
+    with transaction.atomic(savepoint=False):
+        old_bands = RecipeBand.objects.filter(recipe__in=recipe_ids)
+        keys = set(old_bands.values_list('band', 'key'))
+        old_bands.delete()
+        bands = get_bands(ingredient_sets)
+        RecipeBand.objects.bulk_create(bands)
+        keys.update((band.band, band.key) for band in bands)
+        # Корзина меняется не больше чем на len(recipe_ids) рецептов:
+        # корзины крупнее не были и не стали меньше предела
+        affected = set(recipe_ids)
+        for members in get_buckets(
+            keys, SIMILAR_MAX_BUCKET_SIZE + len(recipe_ids)
+        ).values():
+            affected.update(members)
+        candidates = get_candidates(get_buckets(
+            set(RecipeBand.objects.filter(
+                recipe__in=affected
+            ).values_list('band', 'key')),
+            SIMILAR_MAX_BUCKET_SIZE,
+        ))
+        ingredient_sets.update(Recipe.objects.filter(pk__in={
+            candidate
+            for recipe_id in affected
+            for candidate in candidates.get(recipe_id, ())
+        } - ingredient_sets.keys()).values_list('id', 'ingredient_ids'))
+        SimilarRecipe.objects.filter(recipe__in=affected).delete()
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(
+                recipe_id=recipe_id, similar_id=similar_id,
+                similarity=similarity,
+            )
+            for recipe_id in affected & candidates.keys()
+            for similar_id, similarity in get_neighbours(
+                recipe_id, candidates[recipe_id], ingredient_sets
+            )
+        )
+
+
+def rebuild_similar_recipes(batch_size=SIMILAR_BATCH_SIZE):
+    """Строит заново полосы и списки похожих рецептов.
+
+    Возвращает число рецептов и число корзин LSH.
+    """
+    ingredient_sets, bands = {}, []
+    buckets = defaultdict(set)
+    for queryset in iterate_batches(Recipe, batch_size):
+        batch = dict(queryset.values_list('id', 'ingredient_ids'))
+        ingredient_sets.update(batch)
+        for band in get_bands(batch):
+            bands.append(band)
+            buckets[band.band, band.key].add(band.recipe_id)
+    candidates = get_candidates(buckets)
+    with transaction.atomic():
+        RecipeBand.objects.all().delete()
+        RecipeBand.objects.bulk_create(bands, batch_size=batch_size)
+        SimilarRecipe.objects.all().delete()
+        SimilarRecipe.objects.bulk_create(
+            (
+                SimilarRecipe(
+                    recipe_id=recipe_id,
+                    similar_id=similar_id,
+                    similarity=similarity,
+                )
+                for recipe_id, recipe_candidates in candidates.items()
+                for similar_id, similarity in get_neighbours(
+                    recipe_id, recipe_candidates, ingredient_sets
+                )
+            ),
+            batch_size=batch_size,
+        )
+    return len(ingredient_sets), len(buckets)
@@ -0,0 +1,144 @@
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from recipes.constants import PLAN_CHECK_RECIPES, PLAN_CHECK_USERS
+from recipes.ingredient_index import ingredient_index
+from recipes.models import IngredientAmount, Ingredients, Recipe, SimilarRecipe
+from recipes.query_plans import check_plans
+from recipes.sample_data import create_sample_data
+from recipes.similarity import rebuild_similar_recipes, update_similar_recipes
+
+
+class QueryPlanTests(TestCase):
+    """Горячие запросы используют индексы при обычных настройках.
+
+    Данных создаётся столько, чтобы полное чтение таблиц было
+    дороже индекса; статистику собирает create_sample_data.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        create_sample_data(users=PLAN_CHECK_USERS, recipes=PLAN_CHECK_RECIPES)
+
+    def test_query_plans(self):
+        for name, errors, plan in check_plans():
+            with self.subTest(name, vendor=connection.vendor):
+                self.assertEqual(errors, [], plan)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'индекс FTS5 есть только в SQLite')
+class SQLiteSearchTests(TestCase):
+    """Триггеры индекса FTS5 переживают все миграции.
+
+    Миграция, которая пересоздаёт таблицу рецептов и не заканчивается
+    sqlite_search_operation(), удалит их, и поиск перестанет видеть
+    новые рецепты.
+    """
+    def test_search_triggers_exist(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                "AND tbl_name = 'recipes_recipe'"
+            )
+            triggers = {row[0] for row in cursor.fetchall()}
+        self.assertTrue(
+            {'recipes_recipe_search_insert', 'recipes_recipe_search_delete',
+             'recipes_recipe_search_update'} <= triggers,
+            triggers,
+        )
+
+    def test_search_finds_new_recipes(self):
+        create_sample_data(users=2, recipes=5, ingredients=5)
+        recipe = Recipe.objects.order_by('id').first()
+        Recipe.objects.filter(pk=recipe.pk).update(name='Борщ')
+        self.assertEqual(
+            list(Recipe.objects.search('борщ').values_list('id', flat=True)),
+            [recipe.id],
+        )
+
+
+class IngredientIndexTests(TestCase):
+    """Поиск ингредиентов после загрузки справочника не ходит в БД"""
+    @classmethod
+    def setUpTestData(cls):
+        Ingredients.objects.bulk_create(
+            Ingredients(name=name, measurement_unit=unit)
+            for name, unit in (
+                ('Сахар', 'г'), ('Сахарная пудра', 'г'),
+                ('Ванильный сахар', 'г'), ('Тростниковый сахар', 'ст. л.'),
+                ('Соль', 'г'),
+            )
+        )
+
+    def setUp(self):
+        ingredient_index.invalidate()
+        ingredient_index.get_data()
+
+    def search(self, query, limit=10, measurement_unit=None):
+        with self.assertNumQueries(0):
+            results = ingredient_index.search(query, limit, measurement_unit)
+        return [ingredient['name'] for ingredient in results]
+
+    def test_prefix(self):
+        self.assertEqual(self.search('сахар'), [
+            'Сахар', 'Сахарная пудра', 'Ванильный сахар',
+            'Тростниковый сахар',
+        ])
+        self.assertEqual(self.search('Со'), ['Соль'])
+
+    def test_substring(self):
+        self.assertEqual(self.search('пудр'), ['Сахарная пудра'])
+        self.assertEqual(
+            self.search('сахар', limit=3),
+            ['Сахар', 'Сахарная пудра', 'Ванильный сахар'],
+        )
+        self.assertEqual(
+            self.search('сахар', measurement_unit='ст. л.'),
+            ['Тростниковый сахар'],
+        )
+        self.assertEqual(self.search('хар', limit=1), ['Ванильный сахар'])
+        self.assertEqual(self.search('ль'), [])
+
+
+class SimilarRecipesTests(TestCase):
+    """Пересчёт после изменения рецепта совпадает с полной перестройкой"""
+    @classmethod
+    def setUpTestData(cls):
+        create_sample_data(
+            users=3, recipes=60, ingredients=12, ingredients_per_recipe=4
+        )
+
+    def get_similar(self):
+        return sorted(SimilarRecipe.objects.values_list(
+            'recipe_id', 'similar_id', 'similarity'
+        ))
+
+    def change_ingredients(self, recipe, source):
+        IngredientAmount.objects.filter(recipe=recipe).delete()
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe, ingredient_id=amount.ingredient_id,
+                amount=amount.amount,
+            )
+            for amount in source.amount_ingredients.all()
+        )
+        Recipe.objects.filter(pk=recipe.pk).update_computed_fields()
+
+    def assert_matches_rebuild(self, recipe_ids):
+        update_similar_recipes(recipe_ids)
+        similar = self.get_similar()
+        rebuild_similar_recipes()
+        self.assertEqual(similar, self.get_similar())
+
+    def test_update_matches_rebuild(self):
+        recipe, source = Recipe.objects.order_by('id')[:2]
+        self.change_ingredients(recipe, source)
+        self.assert_matches_rebuild([recipe.pk])
+
+    def test_update_matches_rebuild_with_bucket_limit(self):
+        recipes = list(Recipe.objects.order_by('id')[:3])
+        with mock.patch('recipes.similarity.SIMILAR_MAX_BUCKET_SIZE', 3):
+            rebuild_similar_recipes()
+            for recipe in recipes[1:]:
+                self.change_ingredients(recipe, recipes[0])
+            self.assert_matches_rebuild([recipe.pk for recipe in recipes[1:]])
@@ -1,21 +1,27 @@
 from django.contrib import admin
+from recipes.admin import LargeTableAdmin
 
 from .models import Subscriber, User
 
 
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(LargeTableAdmin):
     model = User
     list_display = (
         'username',
         'email',
         'first_name',
         'last_name',
+        'recipes_count',
         'id',
     )
+    # Префиксный поиск по уникальному полю идёт по его индексу
+    search_fields = ('username__startswith',)
 
 
-class SubscriberAdmin(admin.ModelAdmin):
+class SubscriberAdmin(LargeTableAdmin):
     list_display = ('author', 'subscriber',)
+    list_select_related = ('author', 'subscriber')
+    autocomplete_fields = ('author', 'subscriber')
 
 
 admin.site.register(User, UserAdmin)
@@ -23,6 +23,11 @@ class User(AbstractUser):
         'Фамилия',
         max_length=MAX_CHAR_LENGTH_150,
     )
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('username',)
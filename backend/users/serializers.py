@@ -1,3 +1,4 @@
+from django.db import models
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
@@ -5,6 +6,44 @@ from rest_framework.validators import UniqueValidator
 from .models import Subscriber, User
 
 
+def get_followed_ids(author_ids, user):
+    """id авторов из author_ids, на которых подписан пользователь"""
+    if user is None or not user.is_authenticated:
+        return set()
+    return set(Subscriber.objects.filter(
+        author=user,
+        subscriber__in=author_ids
+    ).values_list('subscriber_id', flat=True))
+
+
+def set_subscription_flags(authors, user, followed=None):
+    """Проставляет авторам флаг подписки пользователя одним запросом.
+
+    Подписка хранится как Subscriber(author=подписчик, subscriber=автор).
+    Уже загруженные id авторов можно передать в followed.
+    """
+    missing = [
+        author for author in authors
+        if not hasattr(author, 'is_subscribed')
+    ]
+    if not missing:
+        return
+    if followed is None:
+        followed = get_followed_ids([author.pk for author in missing], user)
+    for author in missing:
+        author.is_subscribed = author.pk in followed
+
+
+class UsersListSerializer(serializers.ListSerializer):
+    """Список пользователей с флагом подписки, вычисленным на всю страницу"""
+    def to_representation(self, data):
+        users = data.all() if isinstance(data, models.Manager) else data
+        users = list(users)
+        request = self.context.get('request')
+        set_subscription_flags(users, getattr(request, 'user', None))
+        return super().to_representation(users)
+
+
 class UsersSerializer(UserSerializer):
     """Сериализатор пользователя"""
     is_subscribed = serializers.SerializerMethodField()
@@ -16,14 +55,12 @@ class UsersSerializer(UserSerializer):
             'username', 'first_name',
             'last_name', 'is_subscribed',
         )
+        list_serializer_class = UsersListSerializer
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Subscriber.objects.filter(
-            subscriber=user,
-            author=obj.id).exists()
+        request = self.context.get('request')
+        set_subscription_flags([obj], getattr(request, 'user', None))
+        return obj.is_subscribed
 
 
 class UsersCreateSerializer(UserCreateSerializer):
@@ -1,5 +1,7 @@
 from api.paginators import CustomPagination
+from api.query_budget import QueryBudgetMixin
 from api.serializers import SubscriberSerializer, SubscriptionSerializer
+from django.db.models import BooleanField, Value
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -11,12 +13,22 @@ from users.serializers import UsersSerializer
 from .models import Subscriber, User
 
 
-class UserViewSet(UserViewSet):
+class UserViewSet(QueryBudgetMixin, UserViewSet):
     """Переопределенный вьюсет для работы с пользователями."""
     queryset = User.objects.all()
     serializer_class = UsersSerializer
     pagination_class = CustomPagination
     permission_classes = (AllowAny,)
+    query_budget = {
+        'list': 4,
+        'retrieve': 3,
+        'me': 2,
+        'subscriptions': 4,
+        'subscribe': 9,
+    }
+    cursor_ordering = {
+        'subscriptions': ('username', 'id'),
+    }
 
     @action(['GET'], permission_classes=(IsAuthenticated,), detail=False)
     def me(self, request):
@@ -26,11 +38,17 @@ class UserViewSet(UserViewSet):
         )
         return Response(serializer.data)
 
+    def get_subscriptions_queryset(self, user):
+        """Авторы, на которых подписан пользователь"""
+        return User.objects.filter(
+            subscriber__author=user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        )
+
     @action(['GET'], detail=False)
     def subscriptions(self, request):
-        queryset = User.objects.filter(
-            subscriber__in=request.user.subscriber.all()
-        )
+        queryset = self.get_subscriptions_queryset(request.user)
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = SubscriptionSerializer(